@@ -0,0 +1,43 @@
+"""
+Audio format selection for the Python service
+Run from the repository root: python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Izzy'))
+
+import ytmusic_service as service  # noqa: E402
+
+# A typical YouTube Music ladder: AAC in m4a (139/140) and Opus in WebM (250/251)
+LADDER = [
+    {'url': 'https://example.invalid/139', 'formatId': '139', 'bitrate': 48.8, 'container': 'm4a'},
+    {'url': 'https://example.invalid/140', 'formatId': '140', 'bitrate': 129.5, 'container': 'm4a'},
+    {'url': 'https://example.invalid/250', 'formatId': '250', 'bitrate': 70.1, 'container': 'webm'},
+    {'url': 'https://example.invalid/251', 'formatId': '251', 'bitrate': 135.2, 'container': 'webm'},
+]
+
+class SelectAudioFormatTests(unittest.TestCase):
+
+    def test_max_prefers_m4a_over_higher_bitrate_webm(self):
+        chosen = service.select_audio_format(LADDER, 'max', 200)
+        self.assertEqual(chosen['formatId'], '140')
+        self.assertFalse(chosen.get('aboveCeiling'))
+
+    def test_ceiling_applies_within_the_playable_container(self):
+        self.assertEqual(service.select_audio_format(LADDER, 'balanced')['formatId'], '140')
+        self.assertEqual(service.select_audio_format(LADDER, 'data-saver')['formatId'], '139')
+
+    def test_unmet_ceiling_takes_the_lowest_playable_bitrate(self):
+        chosen = service.select_audio_format(LADDER, '32kbps')
+        self.assertEqual(chosen['formatId'], '139')
+        self.assertTrue(chosen['aboveCeiling'])
+
+    def test_webm_only_when_nothing_else_is_offered(self):
+        webm = [c for c in LADDER if c['container'] == 'webm']
+        self.assertEqual(service.select_audio_format(webm, 'max')['formatId'], '251')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,11 +5,29 @@ Handles search, stream URL extraction, and YouTube Music API interactions.
 """
 
 import sys
+import os
+import re
+import math
+import atexit
+import queue
+import signal
+import subprocess
+import multiprocessing
 import json
+import time
 import asyncio
 import logging
+import threading
+import unicodedata
+import hashlib
+import base64
 import traceback  # Add traceback for better error reporting
-from typing import Dict, List, Any, Optional
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from typing import Dict, List, Any, Optional, Tuple
+from urllib.parse import urlparse, parse_qs, quote, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from ytmusicapi import YTMusic
 
 # Import additional libraries
@@ -85,8 +103,841 @@ def decode_html_entities(text: str) -> str:
     except Exception:
         return text
 
+# MARK: - Search Cache
+
+# All search categories understood by the Swift MusicSearchResults structure
+SEARCH_CATEGORIES = ('songs', 'albums', 'artists', 'playlists', 'videos')
+
+# 🔋 BATTERY OPTIMIZATION: Repeated searches are answered from memory instead of 4-5 upstream calls
+SEARCH_CACHE_TTL = float(os.environ.get('IZZY_SEARCH_CACHE_TTL', 600))  # seconds
+SEARCH_CACHE_SIZE = int(os.environ.get('IZZY_SEARCH_CACHE_SIZE', 128))  # entries
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query for cache lookups (Unicode, case and whitespace insensitive)"""
+    if not query:
+        return ''
+    return ' '.join(unicodedata.normalize('NFKC', query).casefold().split())
+
+def normalize_categories(categories: Optional[List[str]]) -> Tuple[str, ...]:
+    """Return the requested search categories in canonical order (all categories by default)"""
+    if not categories:
+        return SEARCH_CATEGORIES
+    requested = set(categories)
+    return tuple(c for c in SEARCH_CATEGORIES if c in requested) or SEARCH_CATEGORIES
+
+class SearchCache:
+    """
+    Bounded in-memory cache of search responses with TTL expiry and LRU eviction
+    """
+
+    def __init__(self, ttl: float = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (stored_at, data)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(source: str, query: str, limit: int, categories: Optional[List[str]] = None) -> Tuple:
+        return (source, normalize_query(query), int(limit), normalize_categories(categories))
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, data = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: Tuple, data: Dict[str, Any]):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def age(self, key: Tuple) -> Optional[float]:
+        """Seconds since `key` was stored, or None when it is not cached (does not count as a lookup)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return time.monotonic() - entry[0] if entry is not None else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+search_cache = SearchCache()
+
+# MARK: - Search-As-You-Type
+
+SEARCH_PREFIX_MIN_LENGTH = int(os.environ.get('IZZY_SEARCH_PREFIX_MIN_LENGTH', 2))  # characters
+
+class PrefixResultIndex:
+    """
+    Recent search result sets indexed by normalized query, so a query that extends
+    an earlier one ("arij" -> "arijit s") can be answered locally while upstream runs
+    """
+
+    def __init__(self, ttl: float = SEARCH_CACHE_TTL, max_entries: int = SEARCH_CACHE_SIZE,
+                 min_prefix: int = SEARCH_PREFIX_MIN_LENGTH):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.min_prefix = max(1, min_prefix)
+        self._entries = OrderedDict()  # (source, normalized query) -> (stored_at, data)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, source: str, query: str, data: Dict[str, Any]):
+        normalized = normalize_query(query)
+        if len(normalized) < self.min_prefix or self.max_entries <= 0:
+            return
+        with self._lock:
+            key = (source, normalized)
+            self._entries[key] = (time.monotonic(), data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, source: str, query: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Find the longest cached query that is a prefix of `query`
+        Returns (cached_query, results) or None
+        """
+        normalized = normalize_query(query)
+        now = time.monotonic()
+        with self._lock:
+            # Walk prefixes from longest to shortest - each step is a single dict lookup
+            for end in range(len(normalized), self.min_prefix - 1, -1):
+                key = (source, normalized[:end].rstrip())
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                stored_at, data = entry
+                if now - stored_at > self.ttl:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return key[1], data
+            self.misses += 1
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+def filter_results_for_query(results: Dict[str, List[Dict]], query: str, limit: int) -> Dict[str, List[Dict]]:
+    """
+    Filter and rank cached results locally for a longer query
+    Every query token must prefix a word of the title or artist; title matches rank first
+    """
+    tokens = normalize_query(query).split()
+    filtered = {}
+    for category, items in results.items():
+        ranked = []
+        for position, item in enumerate(items or []):
+            title_words = normalize_query(item.get('title') or '').split()
+            artist_words = normalize_query(item.get('artist') or '').split()
+            score = 0
+            for token in tokens:
+                if any(word.startswith(token) for word in title_words):
+                    score += 2
+                elif any(word.startswith(token) for word in artist_words):
+                    score += 1
+                else:
+                    score = -1
+                    break
+            if score >= 0:
+                ranked.append((-score, position, item))
+        ranked.sort(key=lambda entry: (entry[0], entry[1]))
+        filtered[category] = [item for _, _, item in ranked[:limit]]
+    return filtered
+
+prefix_index = PrefixResultIndex()
+
+# MARK: - Search Suggestions
+
+SUGGESTION_TRIE_SIZE = int(os.environ.get('IZZY_SUGGESTION_TRIE_SIZE', 5000))  # terms
+
+class SuggestionTrie:
+    """
+    Character trie of past queries and result titles for instant local autocomplete
+    """
+
+    def __init__(self, max_terms: int = SUGGESTION_TRIE_SIZE):
+        self.max_terms = max_terms
+        self._root = {}
+        self._terms = {}  # normalized term -> [display text, weight]
+        self._lock = threading.Lock()
+
+    def add(self, text: str, weight: float = 1.0):
+        normalized = normalize_query(text)
+        if not normalized:
+            return
+        with self._lock:
+            term = self._terms.get(normalized)
+            if term is not None:
+                term[1] += weight
+                return
+            self._terms[normalized] = [text.strip(), weight]
+            self._insert(normalized)
+            if len(self._terms) > self.max_terms:
+                self._prune()
+
+    def _insert(self, normalized: str):
+        node = self._root
+        for char in normalized:
+            node = node.setdefault(char, {})
+        node[''] = normalized  # Terminal marker holds the term key
+
+    def _prune(self):
+        # Keep the heaviest half of the terms and rebuild the trie
+        kept = sorted(self._terms.items(), key=lambda entry: entry[1][1], reverse=True)[:self.max_terms // 2]
+        self._terms = dict(kept)
+        self._root = {}
+        for normalized in self._terms:
+            self._insert(normalized)
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        normalized = normalize_query(prefix)
+        if not normalized:
+            return []
+        with self._lock:
+            node = self._root
+            for char in normalized:
+                node = node.get(char)
+                if node is None:
+                    return []
+            matches = []
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                for char, child in current.items():
+                    if char == '':
+                        matches.append(self._terms[child])
+                    else:
+                        stack.append(child)
+            matches.sort(key=lambda term: (-term[1], len(term[0])))
+            return [display for display, _ in matches[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'terms': len(self._terms),
+                'maxTerms': self.max_terms
+            }
+
+suggestion_trie = SuggestionTrie()
+suggestion_cache = SearchCache()  # (source, normalized prefix) -> upstream suggestions
+
+def remember_search(query: str, results: Dict[str, List[Dict]]):
+    """Feed a successful search into the local suggestion trie"""
+    suggestion_trie.add(query, weight=3.0)
+    for category in ('songs', 'artists', 'albums'):
+        for item in results.get(category) or []:
+            if item.get('title'):
+                suggestion_trie.add(item['title'])
+
+# MARK: - Stream URL Cache
+
+STREAM_CACHE_SIZE = int(os.environ.get('IZZY_STREAM_CACHE_SIZE', 256))  # entries
+STREAM_URL_MARGIN = float(os.environ.get('IZZY_STREAM_URL_MARGIN', 300))  # seconds of validity left beyond the track length
+STREAM_URL_DEFAULT_TTL = {
+    'youtube_music': 3600.0,  # Only used when a googlevideo URL carries no expire= parameter
+    'jiosaavn': float(os.environ.get('IZZY_JIOSAAVN_STREAM_TTL', 6 * 3600))
+}
+
+def stream_url_expiry(url: str, default_ttl: float) -> float:
+    """
+    Wall-clock expiry of a stream URL: the signed expire=/Expires= timestamp when present,
+    otherwise now + default_ttl
+    """
+    try:
+        params = parse_qs(urlparse(url).query)
+        for name in ('expire', 'expires', 'Expires'):
+            if params.get(name) and params[name][0].isdigit():
+                return float(params[name][0])
+    except Exception:
+        pass
+    return time.time() + default_ttl
+
+class StreamCache:
+    """
+    Resolved stream info keyed by (source, video ID), served only while the URL stays
+    valid for the whole track plus a safety margin
+    """
+
+    def __init__(self, max_entries: int = STREAM_CACHE_SIZE, margin: float = STREAM_URL_MARGIN):
+        self.max_entries = max_entries
+        self.margin = margin
+        self._entries = OrderedDict()  # key -> (expires_at, data)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def _usable(self, expires_at: float, data: Dict[str, Any]) -> bool:
+        duration = data.get('duration') or 0
+        return expires_at - time.time() > self.margin + float(duration)
+
+    def get(self, source: str, video_id: str) -> Optional[Dict[str, Any]]:
+        key = (source, video_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, data = entry
+            if not self._usable(expires_at, data):
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, source: str, video_id: str, data: Dict[str, Any]):
+        if not data.get('url') or self.max_entries <= 0:
+            return
+        expires_at = stream_url_expiry(data['url'], STREAM_URL_DEFAULT_TTL.get(source, 3600.0))
+        if not self._usable(expires_at, data):
+            return
+        key = (source, video_id)
+        with self._lock:
+            self._entries[key] = (expires_at, data)
+            self._entries.move_to_end(key)
+            # Drop expired entries first, then least recently used ones
+            for stale_key in [k for k, (exp, d) in self._entries.items() if not self._usable(exp, d)]:
+                del self._entries[stale_key]
+                self.expired += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, source: str, video_id: str):
+        """Forget a stream whose URL was rejected upstream before its expiry"""
+        with self._lock:
+            self._entries.pop((source, video_id), None)
+
+    def expires_in(self, source: str, video_id: str) -> Optional[float]:
+        """Seconds until the cached URL expires (None when not cached)"""
+        with self._lock:
+            entry = self._entries.get((source, video_id))
+            return entry[0] - time.time() if entry is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'margin': self.margin,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired
+            }
+
+stream_cache = StreamCache()
+
+# MARK: - Audio Quality Policy
+
+# 🔋 BATTERY OPTIMIZATION: Lower bitrates on metered/slow links mean faster startup and less radio time
+QUALITY_POLICY_TARGETS = {'max': float('inf'), 'balanced': 160.0, 'data-saver': 64.0}  # kbps ceilings
+AUDIO_CONTAINER_PREFERENCE = {'m4a': 2, 'mp4': 2, 'webm': 1}  # AVPlayer plays AAC natively
+
+def normalize_quality_policy(policy: Any) -> str:
+    """
+    Canonical qualityPolicy: 'max', 'balanced', 'data-saver' or a target like '128kbps'
+    Raises ValueError for anything else
+    """
+    if policy is None or policy == '':
+        policy = QUALITY_POLICY
+    text = str(policy).strip().lower()
+    if text in QUALITY_POLICY_TARGETS:
+        return text
+    try:
+        target = float(text[:-4] if text.endswith('kbps') else text)
+    except ValueError:
+        target = 0
+    if target <= 0 or math.isinf(target) or math.isnan(target):
+        raise ValueError(f"Invalid qualityPolicy '{policy}' - use max, balanced, data-saver or a target kbps")
+    return f"{target:g}kbps"
+
+QUALITY_POLICY = normalize_quality_policy(os.environ.get('IZZY_QUALITY_POLICY', 'max'))
+
+def select_audio_format(candidates: List[Dict[str, Any]], policy: Optional[str] = None,
+                        duration: float = 0) -> Optional[Dict[str, Any]]:
+    """
+    Shared audio selector for yt-dlp formats and JioSaavn downloadUrl entries
+    Candidates are {'url', 'bitrate' (kbps), 'container', 'size' (exact bytes), 'approxSize'}: only the best-ranked container is
+    considered (AVPlayer cannot play WebM, so m4a wins whenever it is offered), then the highest bitrate
+    within the policy's ceiling; if every bitrate is above the ceiling the lowest one is taken and
+    flagged with 'aboveCeiling'
+    Returns the chosen candidate with 'estimatedSize' filled in ('size' stays the exact byte count or None)
+    """
+    policy = normalize_quality_policy(policy)
+    ceiling = QUALITY_POLICY_TARGETS[policy] if policy in QUALITY_POLICY_TARGETS else float(policy[:-4])
+    usable = [c for c in candidates or [] if c.get('url')]
+    if not usable:
+        return None
+    
+    best_container = max(AUDIO_CONTAINER_PREFERENCE.get(c.get('container'), 0) for c in usable)
+    usable = [c for c in usable if AUDIO_CONTAINER_PREFERENCE.get(c.get('container'), 0) == best_container]
+    within = [c for c in usable if (c.get('bitrate') or 0) <= ceiling]
+    if within:
+        chosen = max(within, key=lambda c: c.get('bitrate') or 0)
+    else:
+        chosen = dict(min(usable, key=lambda c: c.get('bitrate') or 0), aboveCeiling=True)
+    
+    return dict(chosen, estimatedSize=estimated_size(chosen, duration))
+
+def estimated_size(candidate: Dict[str, Any], duration: float = 0) -> Optional[int]:
+    """Exact size when known, else yt-dlp's approximation, else bitrate x duration"""
+    size = candidate.get('size') or candidate.get('approxSize')
+    if not size and candidate.get('bitrate') and duration:
+        size = candidate['bitrate'] * 1000 / 8 * float(duration)
+    return int(size) if size else None
+
+def format_ladder(candidates: List[Dict[str, Any]], duration: float = 0) -> List[Dict[str, Any]]:
+    """
+    Every playable audio format from one extraction, highest bitrate first, so the client can
+    pre-size buffers and switch quality without another extraction
+    """
+    ladder = []
+    for candidate in candidates or []:
+        if not candidate.get('url'):
+            continue
+        bitrate = candidate.get('bitrate')
+        ladder.append({
+            'formatId': candidate.get('formatId') or candidate.get('quality'),
+            'codec': candidate.get('codec'),
+            'bitrate': bitrate,
+            'container': candidate.get('container'),
+            'contentLength': candidate.get('size'),  # Exact only - the proxy and store rely on it
+            'estimatedSize': estimated_size(candidate, duration),
+            'url': candidate['url']
+        })
+    ladder.sort(key=lambda f: f['bitrate'] or 0, reverse=True)
+    return ladder
+
+def audio_stream_data(chosen: Dict[str, Any], title: str, duration: Any, quality: str, policy: Optional[str],
+                      candidates: Optional[List[Dict[str, Any]]] = None, resolver: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Stream response data for a selected format - 'quality' stays the string the Swift side expects
+    The full format ladder is kept under 'formats' (returned only when a request asks for it)
+    `resolver` names the path that produced the URL so a refresh can repeat just that step
+    """
+    return {
+        'resolver': resolver,
+        'url': chosen['url'],
+        'title': title,
+        'duration': duration,
+        'quality': quality,
+        'formatId': chosen.get('formatId') or chosen.get('quality'),
+        'contentLength': chosen.get('size'),
+        'bitrate': chosen.get('bitrate'),
+        'estimatedSize': chosen.get('estimatedSize') or estimated_size(chosen, duration or 0),
+        'qualityPolicy': normalize_quality_policy(policy),
+        'ceilingMet': not chosen.get('aboveCeiling'),  # False: every format is above the policy's ceiling
+        'formats': format_ladder(candidates or [chosen], duration or 0)
+    }
+
+def without_format_ladder(response: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop the format ladder from a stream response unless the request asked for it"""
+    data = response.get('data')
+    if isinstance(data, dict) and 'formats' in data:
+        response = dict(response, data={k: v for k, v in data.items() if k != 'formats'})
+    return response
+
+# MARK: - Local Storage
+
+# Spawned yt-dlp worker processes re-import this module - only the service process owns persisted state
+IS_SERVICE_PROCESS = multiprocessing.current_process().name == 'MainProcess'
+
+def get_data_dir(*parts: str) -> str:
+    """
+    Return (and create) a persistent data directory for the service
+    Defaults to ~/Library/Application Support/Izzy on macOS, overridable with IZZY_DATA_DIR
+    """
+    base = os.environ.get('IZZY_DATA_DIR')
+    if not base:
+        if sys.platform == 'darwin':
+            base = os.path.join(os.path.expanduser('~'), 'Library', 'Application Support', 'Izzy')
+        else:
+            base = os.path.join(os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share'), 'izzy')
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def write_json_atomic(path: str, data: Any):
+    """Write JSON to `path` via a temporary file so a crash never leaves a truncated file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+# MARK: - Local Track Index
+
+TRACK_INDEX_SIZE = int(os.environ.get('IZZY_TRACK_INDEX_SIZE', 20000))  # tracks
+TRACK_INDEX_SAVE_DELAY = 30.0  # seconds - 🔋 batch index writes instead of writing per response
+
+def _index_keys(text: str) -> set:
+    """Postings keys for a normalized text: trigrams plus 1-2 character word prefixes"""
+    keys = set()
+    for word in text.split():
+        keys.add('^' + word[:1])
+        if len(word) > 1:
+            keys.add('^' + word[:2])
+        for i in range(len(word) - 2):
+            keys.add(word[i:i + 3])
+    return keys
+
+class TrackIndex:
+    """
+    Persistent inverted index (trigram and word-prefix postings) over title, artist and album
+    of every track the service has formatted, with recency and play counts for ranking
+    """
+
+    def __init__(self, path: Optional[str] = None, max_tracks: int = TRACK_INDEX_SIZE):
+        self.path = path
+        self.max_tracks = max_tracks
+        self._tracks = OrderedDict()  # (source, id) -> entry, least recently seen first
+        self._postings = {}  # key -> set of (source, id)
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._save_timer = None
+
+    # Persistence
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            for entry in stored.get('tracks', []):
+                self._insert(entry)
+            print(f"📚 Loaded local track index with {len(self._tracks)} tracks", file=sys.stderr)
+        except Exception as e:
+            logger.warning(f"Could not load track index: {e}")
+
+    def _schedule_save(self):
+        if not self.path or self._save_timer is not None:
+            return
+        self._save_timer = threading.Timer(TRACK_INDEX_SAVE_DELAY, self.save)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def save(self):
+        with self._lock:
+            self._save_timer = None
+            if not self.path or not self._loaded:
+                return
+            tracks = list(self._tracks.values())
+        try:
+            write_json_atomic(self.path, {'version': 1, 'tracks': tracks})
+        except Exception as e:
+            logger.warning(f"Could not save track index: {e}")
+
+    # Indexing
+
+    @staticmethod
+    def _entry_text(entry: Dict[str, Any]) -> str:
+        return normalize_query(' '.join(filter(None, (entry['track'].get('title'), entry['track'].get('artist'), entry.get('album')))))
+
+    def _insert(self, entry: Dict[str, Any]):
+        key = (entry['source'], entry['track']['id'])
+        self._tracks[key] = entry
+        self._tracks.move_to_end(key)
+        for posting in _index_keys(self._entry_text(entry)):
+            self._postings.setdefault(posting, set()).add(key)
+
+    def _remove(self, key: Tuple):
+        entry = self._tracks.pop(key, None)
+        if entry is None:
+            return
+        for posting in _index_keys(self._entry_text(entry)):
+            ids = self._postings.get(posting)
+            if ids is not None:
+                ids.discard(key)
+                if not ids:
+                    del self._postings[posting]
+
+    def add(self, track: Dict[str, Any], source: str, album: Optional[str] = None):
+        """Record a formatted track (called from the result formatters)"""
+        if not track or not track.get('id') or not track.get('title'):
+            return
+        with self._lock:
+            self._ensure_loaded()
+            key = (source, track['id'])
+            previous = self._tracks.get(key)
+            if previous is not None:
+                self._remove(key)
+            self._insert({
+                'source': source,
+                'track': track,
+                'album': album or (previous or {}).get('album'),
+                'lastSeen': time.time(),
+                'playCount': (previous or {}).get('playCount', 0),
+                'lastPlayed': (previous or {}).get('lastPlayed')
+            })
+            while len(self._tracks) > self.max_tracks:
+                self._remove(next(iter(self._tracks)))
+            self._schedule_save()
+
+    def get_track(self, source: str, track_id: str) -> Optional[Dict[str, Any]]:
+        """Return the indexed track record for an ID, if the service has seen it"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._tracks.get((source, track_id))
+            return entry['track'] if entry is not None else None
+
+    def play_count(self, source: str, track_id: str) -> int:
+        """How often the service has streamed a track (0 when it is not indexed)"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._tracks.get((source, track_id))
+            return entry.get('playCount', 0) if entry is not None else 0
+
+    def record_play(self, source: str, track_id: str):
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._tracks.get((source, track_id))
+            if entry is None:
+                return
+            entry['playCount'] = entry.get('playCount', 0) + 1
+            entry['lastPlayed'] = time.time()
+            self._schedule_save()
+
+    # Querying
+
+    def search(self, query: str, limit: int = 20, sort: str = 'relevance', source: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Find tracks whose title/artist/album contain every query word (prefix match for short words)
+        sort: 'relevance' (text match + recency + plays), 'recent' or 'plays'
+        """
+        words = normalize_query(query).split()
+        if not words:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            candidates = None
+            for word in words:
+                trigrams = {word[i:i + 3] for i in range(len(word) - 2)}
+                for posting in (trigrams or {'^' + word}):
+                    ids = self._postings.get(posting, set())
+                    candidates = set(ids) if candidates is None else candidates & ids
+                    if not candidates:
+                        return []
+            
+            now = time.time()
+            scored = []
+            for key in candidates:
+                entry = self._tracks[key]
+                if source and entry['source'] != source:
+                    continue
+                title = normalize_query(entry['track'].get('title') or '')
+                artist = normalize_query(entry['track'].get('artist') or '')
+                text = self._entry_text(entry)
+                if not all(word in text for word in words):
+                    continue  # Trigram postings can produce false positives
+                relevance = sum(3 if word in title else 2 if word in artist else 1 for word in words)
+                if title.startswith(words[0]):
+                    relevance += 2
+                last_used = max(entry.get('lastPlayed') or 0, entry.get('lastSeen') or 0)
+                recency = 1.0 / (1.0 + (now - last_used) / 86400.0)  # Decays over days
+                plays = entry.get('playCount', 0)
+                if sort == 'recent':
+                    score = (last_used,)
+                elif sort == 'plays':
+                    score = (plays, last_used)
+                else:
+                    score = (relevance + 2 * recency + math.log1p(plays),)
+                scored.append((score, entry))
+            
+            scored.sort(key=lambda pair: pair[0], reverse=True)
+            return [dict(entry['track'], source=entry['source']) for _, entry in scored[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                'tracks': len(self._tracks),
+                'maxTracks': self.max_tracks,
+                'postings': len(self._postings)
+            }
+
+def _open_track_index() -> TrackIndex:
+    if not IS_SERVICE_PROCESS:
+        return TrackIndex()
+    try:
+        return TrackIndex(os.path.join(get_data_dir(), 'track_index.json'))
+    except Exception as e:
+        logger.warning(f"Track index will not be persisted: {e}")
+        return TrackIndex()
+
+track_index = _open_track_index()
+if IS_SERVICE_PROCESS:
+    atexit.register(track_index.save)
+
+# MARK: - Background Lane
+
+BACKGROUND_IDLE_DELAY = float(os.environ.get('IZZY_BACKGROUND_IDLE_DELAY', 15))  # seconds without requests
+
+_power_state = {'checked_at': 0.0, 'on_mains': True}
+
+def on_mains_power() -> bool:
+    """
+    🔋 True when the Mac is running on AC power (checked via pmset, cached for a minute)
+    Other platforms are assumed to be on mains power
+    """
+    if sys.platform != 'darwin':
+        return True
+    now = time.monotonic()
+    if now - _power_state['checked_at'] > 60:
+        _power_state['checked_at'] = now
+        try:
+            output = subprocess.run(['pmset', '-g', 'batt'], capture_output=True, text=True, timeout=2).stdout
+            _power_state['on_mains'] = 'AC Power' in output
+        except Exception:
+            _power_state['on_mains'] = False  # Unknown - behave as if on battery
+    return _power_state['on_mains']
+
+class BackgroundLane:
+    """
+    Single low-priority worker thread for speculative work (prefetching, cache refreshes)
+    Tasks run only while no interactive request is in flight and should call
+    should_yield() between units of work so interactive requests are never delayed
+    """
+
+    def __init__(self, idle_delay: float = BACKGROUND_IDLE_DELAY):
+        self.idle_delay = idle_delay
+        self._tasks = queue.Queue()
+        self._idle_tasks = []  # [callable, interval, last_run]
+        self._interactive = threading.Event()
+        self._quiet = threading.Event()  # Set while no interactive request is in flight
+        self._quiet.set()
+        self._last_interactive = time.monotonic()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.interrupted = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='background-lane', daemon=True)
+                self._thread.start()
+
+    def submit(self, task, *args):
+        """Queue a one-off background task"""
+        self.start()
+        self._tasks.put((task, args))
+
+    def add_idle_task(self, task, interval: float):
+        """Run `task` at most every `interval` seconds while the service is idle"""
+        with self._lock:
+            self._idle_tasks.append([task, interval, 0.0])
+        self.start()
+
+    def interactive_started(self):
+        self._interactive.set()
+        self._quiet.clear()
+        self._last_interactive = time.monotonic()
+
+    def interactive_finished(self):
+        self._last_interactive = time.monotonic()
+        self._interactive.clear()
+        self._quiet.set()
+
+    def should_yield(self) -> bool:
+        return self._interactive.is_set()
+
+    def is_idle(self) -> bool:
+        return not self._interactive.is_set() and time.monotonic() - self._last_interactive >= self.idle_delay
+
+    def _run_task(self, task, args):
+        try:
+            task(*args)
+            if self.should_yield():
+                self.interrupted += 1
+            else:
+                self.completed += 1
+        except Exception as e:
+            logger.warning(f"Background task failed: {e}")
+
+    def _run(self):
+        while True:
+            try:
+                task, args = self._tasks.get(timeout=1.0)
+            except queue.Empty:
+                task = None
+            # Never compete with an interactive request
+            self._quiet.wait()
+            if task is not None:
+                self._run_task(task, args)
+                continue
+            if not self.is_idle():
+                continue
+            now = time.monotonic()
+            with self._lock:
+                due = [entry for entry in self._idle_tasks if now - entry[2] >= entry[1]]
+            for entry in due:
+                if not self.is_idle():
+                    break
+                entry[2] = now
+                self._run_task(entry[0], ())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': self._tasks.qsize(),
+            'completed': self.completed,
+            'interrupted': self.interrupted,
+            'idle': self.is_idle()
+        }
+
+background_lane = BackgroundLane()
+
 # MARK: - JioSaavn Service
 
+# ⚡ Raw song objects from search/album/playlist/artist/suggestion payloads already carry downloadUrl
+# and lyrics metadata - keeping them lets stream and lyrics skip the per-song details call
+JIOSAAVN_SONG_CACHE_SIZE = int(os.environ.get('IZZY_JIOSAAVN_SONG_CACHE_SIZE', 2000))  # songs
+JIOSAAVN_SONG_CACHE_TTL = STREAM_URL_DEFAULT_TTL['jiosaavn'] - STREAM_URL_MARGIN  # keep in step with URL validity
+
 class JioSaavnService:
     """
     JioSaavn music service integration using saavn.dev API
@@ -94,8 +945,57 @@ class JioSaavnService:
     
     def __init__(self):
         self.base_url = "https://saavn.dev/api"
+        self._songs = OrderedDict()  # song ID -> (stored_at, raw song object)
+        self._songs_lock = threading.Lock()
+        self.song_cache_hits = 0
+        self.song_cache_misses = 0
+    
+    def _remember_song(self, song: Dict[str, Any]):
+        """
+        Keep a raw saavn.dev song object (bounded, newest last)
+        A partial payload (e.g. a search result) is merged into a fuller cached one instead of replacing it;
+        the merged entry keeps its old timestamp while it still carries fields the new payload lacks
+        """
+        if JIOSAAVN_SONG_CACHE_SIZE <= 0 or not isinstance(song, dict) or not song.get('id'):
+            return
+        fields = {key: value for key, value in song.items() if value not in (None, '', [], {})}
+        with self._songs_lock:
+            stored_at, cached = self._songs.get(song['id'], (None, None))
+            if cached is not None and time.time() - stored_at <= JIOSAAVN_SONG_CACHE_TTL:
+                if not set(cached) <= set(fields):
+                    fields = dict(cached, **fields)
+                else:
+                    stored_at = None
+            else:
+                stored_at = None
+            self._songs[song['id']] = (stored_at or time.time(), fields)
+            self._songs.move_to_end(song['id'])
+            while len(self._songs) > JIOSAAVN_SONG_CACHE_SIZE:
+                self._songs.popitem(last=False)
+    
+    def _cached_song(self, song_id: str, needs: str) -> Optional[Dict[str, Any]]:
+        """A fresh raw song object that has the `needs` field, or None"""
+        with self._songs_lock:
+            entry = self._songs.get(song_id)
+            if entry is not None and time.time() - entry[0] > JIOSAAVN_SONG_CACHE_TTL:
+                del self._songs[song_id]
+                entry = None
+            if entry is None or needs not in entry[1]:
+                self.song_cache_misses += 1
+                return None
+            self.song_cache_hits += 1
+            return entry[1]
+    
+    def song_cache_stats(self) -> Dict[str, Any]:
+        with self._songs_lock:
+            return {
+                'entries': len(self._songs),
+                'maxEntries': JIOSAAVN_SONG_CACHE_SIZE,
+                'hits': self.song_cache_hits,
+                'misses': self.song_cache_misses
+            }
         
-    def search_all(self, query: str, limit: int = 20) -> Dict[str, Any]:
+    def search_all(self, query: str, limit: int = 20, categories: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         Search across JioSaavn music library using saavn.dev API
         """
@@ -114,73 +1014,33 @@ class JioSaavnService:
                 'videos': []
             }
             
-            # Search songs
-            try:
-                songs_response = requests.get(f"{self.base_url}/search/songs", params={
-                    'query': query,
-                    'page': 0,
-                    'limit': limit
-                }, timeout=10)
-                if songs_response.status_code == 200:
-                    songs_data = songs_response.json()
-                    if songs_data.get('success') and songs_data.get('data'):
-                        for song in songs_data['data'].get('results', [])[:limit]:
-                            formatted_song = self._format_jiosaavn_song(song)
-                            if formatted_song:
-                                results['songs'].append(formatted_song)
-            except Exception as e:
-                print(f"Error searching songs: {e}", file=sys.stderr)
-            
-            # Search albums
-            try:
-                albums_response = requests.get(f"{self.base_url}/search/albums", params={
-                    'query': query,
-                    'page': 0,
-                    'limit': limit
-                }, timeout=10)
-                if albums_response.status_code == 200:
-                    albums_data = albums_response.json()
-                    if albums_data.get('success') and albums_data.get('data'):
-                        for album in albums_data['data'].get('results', [])[:limit]:
-                            formatted_album = self._format_jiosaavn_album(album)
-                            if formatted_album:
-                                results['albums'].append(formatted_album)
-            except Exception as e:
-                print(f"Error searching albums: {e}", file=sys.stderr)
-            
-            # Search artists
-            try:
-                artists_response = requests.get(f"{self.base_url}/search/artists", params={
-                    'query': query,
-                    'page': 0,
-                    'limit': limit
-                }, timeout=10)
-                if artists_response.status_code == 200:
-                    artists_data = artists_response.json()
-                    if artists_data.get('success') and artists_data.get('data'):
-                        for artist in artists_data['data'].get('results', [])[:limit]:
-                            formatted_artist = self._format_jiosaavn_artist(artist)
-                            if formatted_artist:
-                                results['artists'].append(formatted_artist)
-            except Exception as e:
-                print(f"Error searching artists: {e}", file=sys.stderr)
+            # Search endpoint and formatter for each category (JioSaavn has no videos)
+            search_endpoints = {
+                'songs': self._format_jiosaavn_song,
+                'albums': self._format_jiosaavn_album,
+                'artists': self._format_jiosaavn_artist,
+                'playlists': self._format_jiosaavn_playlist
+            }
             
-            # Search playlists
-            try:
-                playlists_response = requests.get(f"{self.base_url}/search/playlists", params={
-                    'query': query,
-                    'page': 0,
-                    'limit': limit
-                }, timeout=10)
-                if playlists_response.status_code == 200:
-                    playlists_data = playlists_response.json()
-                    if playlists_data.get('success') and playlists_data.get('data'):
-                        for playlist in playlists_data['data'].get('results', [])[:limit]:
-                            formatted_playlist = self._format_jiosaavn_playlist(playlist)
-                            if formatted_playlist:
-                                results['playlists'].append(formatted_playlist)
-            except Exception as e:
-                print(f"Error searching playlists: {e}", file=sys.stderr)
+            for category in normalize_categories(categories):
+                formatter = search_endpoints.get(category)
+                if formatter is None:
+                    continue
+                try:
+                    response = requests.get(f"{self.base_url}/search/{category}", params={
+                        'query': query,
+                        'page': 0,
+                        'limit': limit
+                    }, timeout=10)
+                    if response.status_code == 200:
+                        response_data = response.json()
+                        if response_data.get('success') and response_data.get('data'):
+                            for item in response_data['data'].get('results', [])[:limit]:
+                                formatted_item = formatter(item)
+                                if formatted_item:
+                                    results[category].append(formatted_item)
+                except Exception as e:
+                    print(f"Error searching {category}: {e}", file=sys.stderr)
             
             return {
                 'success': True,
@@ -197,6 +1057,8 @@ class JioSaavnService:
     def _format_jiosaavn_song(self, song: Dict) -> Optional[Dict]:
         """Format JioSaavn song result from saavn.dev API"""
         try:
+            self._remember_song(song)
+            
             # Get the highest quality image
             image_url = ''
             if song.get('image') and isinstance(song['image'], list) and len(song['image']) > 0:
@@ -214,8 +1076,9 @@ class JioSaavnService:
             
             # Decode HTML entities in title
             title = decode_html_entities(song.get('name', '').strip())
+            album_name = decode_html_entities((song.get('album') or {}).get('name') or '')
             
-            return {
+            result = {
                 'id': song.get('id', ''),
                 'type': 'songs',
                 'title': title,
@@ -228,6 +1091,11 @@ class JioSaavnService:
                 'year': str(song.get('year', '')) if song.get('year') else None,
                 'playCount': str(song.get('playCount', '')) if song.get('playCount') else None
             }
+            
+            # Remember every track we have seen for offline local search
+            track_index.add(result, 'jiosaavn', album=album_name)
+            
+            return result
         except Exception as e:
             logger.error(f"Error formatting JioSaavn song: {e}")
             return None
@@ -325,135 +1193,160 @@ class JioSaavnService:
             logger.error(f"Error formatting JioSaavn playlist: {e}")
             return None
     
-    def get_stream_info(self, video_id: str) -> Dict[str, Any]:
-        """Get JioSaavn stream info using saavn.dev API"""
+    def get_top_result(self, query: str) -> Dict[str, Any]:
+        """Get the best matching song for a query (first song hit) using saavn.dev API"""
         try:
             if not HAS_REQUESTS:
                 return {
                     'success': False,
-                    'error': 'requests library not available - JioSaavn streaming not supported'
+                    'error': 'requests library not available'
                 }
             
-            print(f"🎵 Getting stream info for JioSaavn song ID: {video_id}", file=sys.stderr)
-            
-            # Get song details using the correct endpoint format
-            response = requests.get(f"{self.base_url}/songs", params={
-                'ids': video_id  # Use 'ids' instead of 'id'
+            response = requests.get(f"{self.base_url}/search/songs", params={
+                'query': query,
+                'page': 0,
+                'limit': 1
             }, timeout=10)
             
-            print(f"🎵 JioSaavn API response status: {response.status_code}", file=sys.stderr)
-            
             if response.status_code != 200:
-                # Try alternative endpoint format
-                try:
-                    response = requests.get(f"{self.base_url}/songs/{video_id}", timeout=10)
-                    print(f"🎵 Alternative endpoint response: {response.status_code}", file=sys.stderr)
-                except Exception as e:
-                    print(f"🎵 Alternative endpoint failed: {e}", file=sys.stderr)
-                
-                if response.status_code != 200:
-                    return {
-                        'success': False,
-                        'error': f'Failed to fetch song details: HTTP {response.status_code}'
-                    }
-            
-            data = response.json()
-            print(f"🎵 JioSaavn API response data keys: {list(data.keys()) if isinstance(data, dict) else f'List with {len(data)} items' if isinstance(data, list) else type(data)}", file=sys.stderr)
-            
-            if not data.get('success') or not data.get('data'):
                 return {
                     'success': False,
-                    'error': 'Song not found or no data available'
+                    'error': f'Failed to search songs: HTTP {response.status_code}'
                 }
             
-            songs = data['data'] if isinstance(data['data'], list) else [data['data']]
-            if not songs:
+            data = response.json()
+            songs = (data.get('data') or {}).get('results') or [] if data.get('success') else []
+            top_result = self._format_jiosaavn_song(songs[0]) if songs else None
+            if not top_result:
                 return {
                     'success': False,
-                    'error': 'No song data found'
+                    'error': 'No top result found'
                 }
             
-            song_data = songs[0]
-            print(f"🎵 Song data keys: {list(song_data.keys()) if isinstance(song_data, dict) else f'Type: {type(song_data)}'}", file=sys.stderr)
+            return {
+                'success': True,
+                'data': top_result
+            }
             
-            # Get stream URLs - JioSaavn provides multiple quality options
-            download_url = ''
-            quality = 'unknown'
+        except Exception as e:
+            logger.error(f"JioSaavn top result failed: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def get_search_suggestions(self, query: str) -> Dict[str, Any]:
+        """saavn.dev has no autocomplete endpoint - suggestions come from the local trie only"""
+        return {
+            'success': True,
+            'data': []
+        }
+    
+    def get_stream_info(self, video_id: str, quality_policy: Optional[str] = None) -> Dict[str, Any]:
+        """Get JioSaavn stream info using saavn.dev API"""
+        try:
+            if not HAS_REQUESTS:
+                return {
+                    'success': False,
+                    'error': 'requests library not available - JioSaavn streaming not supported'
+                }
             
-            # Try to get the highest quality download URL
-            if song_data.get('downloadUrl'):
-                download_urls = song_data['downloadUrl']
+            song_data = self._cached_song(video_id, 'downloadUrl')
+            if song_data is not None:
+                print(f"⚡ JioSaavn stream from cached song payload: {video_id}", file=sys.stderr)
+            else:
+                print(f"🎵 Getting stream info for JioSaavn song ID: {video_id}", file=sys.stderr)
+                
+                # Get song details using the correct endpoint format
+                response = requests.get(f"{self.base_url}/songs", params={
+                    'ids': video_id  # Use 'ids' instead of 'id'
+                }, timeout=10)
+                
+                print(f"🎵 JioSaavn API response status: {response.status_code}", file=sys.stderr)
+                
+                if response.status_code != 200:
+                    # Try alternative endpoint format
+                    try:
+                        response = requests.get(f"{self.base_url}/songs/{video_id}", timeout=10)
+                        print(f"🎵 Alternative endpoint response: {response.status_code}", file=sys.stderr)
+                    except Exception as e:
+                        print(f"🎵 Alternative endpoint failed: {e}", file=sys.stderr)
+                
+                    if response.status_code != 200:
+                        return {
+                            'success': False,
+                            'error': f'Failed to fetch song details: HTTP {response.status_code}'
+                        }
+                
+                data = response.json()
+                print(f"🎵 JioSaavn API response data keys: {list(data.keys()) if isinstance(data, dict) else f'List with {len(data)} items' if isinstance(data, list) else type(data)}", file=sys.stderr)
+                
+                if not data.get('success') or not data.get('data'):
+                    return {
+                        'success': False,
+                        'error': 'Song not found or no data available'
+                    }
+                
+                songs = data['data'] if isinstance(data['data'], list) else [data['data']]
+                if not songs:
+                    return {
+                        'success': False,
+                        'error': 'No song data found'
+                    }
+                
+                song_data = songs[0]
+                self._remember_song(song_data)
+            print(f"🎵 Song data keys: {list(song_data.keys()) if isinstance(song_data, dict) else f'Type: {type(song_data)}'}", file=sys.stderr)
+            
+            # Collect every offered quality, then let the shared selector apply the quality policy
+            candidates = []
+            
+            if song_data.get('downloadUrl'):
+                download_urls = song_data['downloadUrl']
                 
                 # Handle both dictionary and list formats  
                 if isinstance(download_urls, dict):
                     print(f"🎵 Available download qualities (dict): {list(download_urls.keys())}", file=sys.stderr)
-                    # Prefer 320kbps, then 160kbps, then 96kbps, then 48kbps
-                    for qual in ['320kbps', '160kbps', '96kbps', '48kbps']:
-                        if download_urls.get(qual):
-                            download_url = download_urls[qual]
-                            quality = qual
-                            print(f"🎵 Selected quality: {quality}", file=sys.stderr)
-                            break
-                elif isinstance(download_urls, list) and len(download_urls) > 0:
-                    # If it's a list of objects with quality and url properties (new API format)
+                    entries = [{'quality': qual, 'url': url} for qual, url in download_urls.items()]
+                elif isinstance(download_urls, list):
+                    # List of objects with quality and url properties (new API format) or plain URL strings
                     print(f"🎵 Download URLs list format, {len(download_urls)} options available", file=sys.stderr)
-                    # Look for the highest quality in the list
-                    best_url = None
-                    best_quality = 'unknown'
-                    
-                    # Sort by quality preference
-                    quality_priority = {'320kbps': 5, '160kbps': 4, '96kbps': 3, '48kbps': 2, '12kbps': 1}
-                    
-                    for url_info in download_urls:
-                        if isinstance(url_info, dict):
-                            # Check for quality and url properties in the DownloadLink format
-                            url = url_info.get('url')
-                            quality_str = url_info.get('quality', 'unknown')
-                            
-                            if url:
-                                # Prioritize higher quality
-                                current_priority = quality_priority.get(quality_str, 0)
-                                best_priority = quality_priority.get(best_quality, 0)
-                                
-                                if best_url is None or current_priority > best_priority:
-                                    best_url = url
-                                    best_quality = quality_str
-                                    print(f"🎵 Found better quality: {quality_str}", file=sys.stderr)
-                        elif isinstance(url_info, str):
-                            # Fallback for direct URL strings
-                            if best_url is None:
-                                best_url = url_info
-                                best_quality = 'unknown'
-                    
-                    if best_url:
-                        download_url = best_url
-                        quality = best_quality
-                        print(f"🎵 Selected URL from list: {quality}", file=sys.stderr)
+                    entries = [url_info if isinstance(url_info, dict) else {'url': url_info} for url_info in download_urls]
                 else:
                     print(f"🎵 Unexpected downloadUrl format: {type(download_urls)}", file=sys.stderr)
+                    entries = []
+                
+                for entry in entries:
+                    quality_str = entry.get('quality') or 'unknown'
+                    bitrate = re.match(r'(\d+)\s*kbps', str(quality_str).lower())
+                    candidates.append({
+                        'url': entry.get('url'),
+                        'quality': quality_str,
+                        'bitrate': float(bitrate.group(1)) if bitrate else None,
+                        'codec': 'aac',
+                        'container': 'mp4'
+                    })
             else:
                 # Check for alternative field names
                 for field in ['media_url', 'stream_url', 'url', 'link']:
                     if song_data.get(field):
-                        download_url = song_data[field]
-                        quality = 'default'
+                        candidates.append({'url': song_data[field], 'quality': 'default', 'container': 'mp4'})
                         print(f"🎵 Using alternative field '{field}' for stream URL", file=sys.stderr)
                         break
             
-            if not download_url:
+            duration = int(song_data.get('duration') or 0)
+            chosen = select_audio_format(candidates, quality_policy, duration)
+            if not chosen:
                 return {
                     'success': False,
                     'error': 'No stream URL available for this song'
                 }
             
+            print(f"🎵 Selected quality: {chosen['quality']}", file=sys.stderr)
             return {
                 'success': True,
-                'data': {
-                    'url': download_url,
-                    'title': song_data.get('name', ''),
-                    'duration': int(song_data.get('duration', 0)),
-                    'quality': quality
-                }
+                'data': audio_stream_data(chosen, song_data.get('name', ''), duration, chosen['quality'], quality_policy,
+                                          candidates)
             }
             
         except Exception as e:
@@ -667,31 +1560,37 @@ class JioSaavnService:
                     'error': 'requests library not available'
                 }
             
-            response = requests.get(f"{self.base_url}/songs", params={
-                'id': video_id
-            }, timeout=10)
-            
-            if response.status_code != 200:
-                return {
-                    'success': False,
-                    'error': f'Failed to fetch song details: HTTP {response.status_code}'
-                }
-            
-            data = response.json()
-            if not data.get('success') or not data.get('data'):
-                return {
-                    'success': False,
-                    'error': 'Song not found'
-                }
-            
-            songs = data['data'] if isinstance(data['data'], list) else [data['data']]
-            if not songs:
-                return {
-                    'success': False,
-                    'error': 'No song data found'
-                }
-            
-            song_data = songs[0]
+            # A cached payload answers when it has the lyrics or says there are none
+            song_data = self._cached_song(video_id, 'hasLyrics')
+            if song_data is not None and song_data['hasLyrics'] and not song_data.get('lyrics'):
+                song_data = None
+            if song_data is None:
+                response = requests.get(f"{self.base_url}/songs", params={
+                    'id': video_id
+                }, timeout=10)
+                
+                if response.status_code != 200:
+                    return {
+                        'success': False,
+                        'error': f'Failed to fetch song details: HTTP {response.status_code}'
+                    }
+                
+                data = response.json()
+                if not data.get('success') or not data.get('data'):
+                    return {
+                        'success': False,
+                        'error': 'Song not found'
+                    }
+                
+                songs = data['data'] if isinstance(data['data'], list) else [data['data']]
+                if not songs:
+                    return {
+                        'success': False,
+                        'error': 'No song data found'
+                    }
+                
+                song_data = songs[0]
+                self._remember_song(song_data)
             
             # Check if lyrics are available
             if song_data.get('lyrics'):
@@ -720,12 +1619,546 @@ class JioSaavnService:
 # 🔋 BATTERY OPTIMIZATION: Check for optional dependencies
 HAS_YTMUSICAPI = True
 
+# Innertube search params for filtered searches (used by the lean search parser)
+try:
+    from ytmusicapi.parsers.search import get_search_params
+except ImportError:
+    get_search_params = None
+
+# ⚡ Parse raw innertube search responses directly instead of through ytmusicapi's generic parsers
+USE_FAST_SEARCH_PARSER = os.environ.get('IZZY_FAST_SEARCH_PARSER', '1') != '0' and get_search_params is not None
+
+_DURATION_PATTERN = re.compile(r'^\d+(:\d{2}){1,2}$')
+_YEAR_PATTERN = re.compile(r'^\d{4}$')
+_COUNT_SUFFIXES = ('views', 'plays', 'subscribers', 'songs', 'tracks')
+_SEARCH_ITEM_LABELS = {'song', 'video', 'album', 'single', 'ep', 'artist', 'playlist', 'episode', 'profile'}
+
+def _text_runs(renderer: Dict, column: int) -> List[Dict]:
+    """Text runs of a flex column of a musicResponsiveListItemRenderer"""
+    columns = renderer.get('flexColumns') or []
+    if column >= len(columns):
+        return []
+    return ((columns[column].get('musicResponsiveListItemFlexColumnRenderer') or {}).get('text') or {}).get('runs') or []
+
+def _run_page_type(run: Dict) -> Optional[str]:
+    return ((((run.get('navigationEndpoint') or {}).get('browseEndpoint') or {})
+             .get('browseEndpointContextSupportedConfigs') or {})
+            .get('browseEndpointContextMusicConfig') or {}).get('pageType')
+
 try:
     import aiohttp
 except ImportError:
     # aiohttp is optional for basic functionality
     pass
 
+search_parser_stats = {'fast': 0, 'fallback': 0}
+
+# 🔋 BATTERY OPTIMIZATION: Reuse YoutubeDL instances instead of rebuilding one per extraction
+YTDLP_POOL_SIZE = int(os.environ.get('IZZY_YTDLP_POOL_SIZE', 4))  # instances
+YTDLP_RECYCLE_AFTER = int(os.environ.get('IZZY_YTDLP_RECYCLE_AFTER', 50))  # extractions per instance
+
+# ⚡ Hedged extraction: the second host only starts once the first has run longer than the observed
+# p90 extraction time, so it fires on real stalls rather than on ordinary slow extractions
+# IZZY_STREAM_HEDGE_DELAY pins a fixed delay instead (0 = race both at once, < 0 = sequential)
+STREAM_HEDGE_DELAY = float(os.environ['IZZY_STREAM_HEDGE_DELAY']) if os.environ.get('IZZY_STREAM_HEDGE_DELAY') else None
+STREAM_HEDGE_DEFAULT_DELAY = 5.0  # seconds, until enough extractions have been timed
+STREAM_HEDGE_MIN_DELAY = 2.0  # seconds - never hedge sooner than this
+STREAM_HEDGE_MIN_SAMPLES = 10
+STREAM_EXTRACTION_HOSTS = ('music.youtube.com', 'www.youtube.com')
+
+class ExtractionLatency:
+    """
+    Sliding window of successful stream extraction times, used to pick the hedge delay
+    """
+
+    def __init__(self, samples: int = 50):
+        self._samples = deque(maxlen=samples)
+        self._lock = threading.Lock()
+        self.hedged = 0
+        self.hedges_skipped = 0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count_hedge(self, skipped: bool = False):
+        with self._lock:
+            if skipped:
+                self.hedges_skipped += 1
+            else:
+                self.hedged += 1
+
+    def _p90(self) -> Optional[float]:
+        if len(self._samples) < STREAM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the first host before starting the next one"""
+        if STREAM_HEDGE_DELAY is not None:
+            return STREAM_HEDGE_DELAY
+        with self._lock:
+            p90 = self._p90()
+        return STREAM_HEDGE_DEFAULT_DELAY if p90 is None else max(STREAM_HEDGE_MIN_DELAY, p90)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            p90 = self._p90()
+            return {
+                'samples': len(self._samples),
+                'p90': round(p90, 3) if p90 is not None else None,
+                'hedged': self.hedged,
+                'hedgesSkipped': self.hedges_skipped
+            }
+
+extraction_latency = ExtractionLatency()
+
+class YoutubeDLPool:
+    """
+    Small pool of long-lived YoutubeDL instances
+    An instance is checked out by one thread at a time and recycled after a number of
+    extractions to bound memory held by its extractor and player caches
+    """
+
+    def __init__(self, options: Dict[str, Any], size: int = YTDLP_POOL_SIZE, recycle_after: int = YTDLP_RECYCLE_AFTER):
+        self.options = options
+        self.size = max(1, size)
+        self.recycle_after = max(1, recycle_after)
+        self._idle = []  # (instance, uses) - most recently used last, handed out first to keep caches warm
+        self._created = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)  # an instance was returned or a slot freed
+        self.extractions = 0
+        self.recycled = 0
+
+    def _new_instance(self):
+        return YoutubeDL(dict(self.options))
+
+    @staticmethod
+    def _close(instance):
+        try:
+            instance.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def acquire(self):
+        """
+        Check out an idle instance, create one while below the pool size, or wait for either
+        A recycled instance frees its slot and wakes a waiter, which then creates the replacement
+        """
+        with self._available:
+            while not self._idle and self._created >= self.size:
+                self._available.wait()
+            if self._idle:
+                instance, uses = self._idle.pop()
+            else:
+                instance, uses = None, 0
+                self._created += 1
+        if instance is None:
+            try:
+                instance = self._new_instance()
+            except Exception:
+                with self._available:
+                    self._created -= 1
+                    self._available.notify()
+                raise
+        
+        try:
+            yield instance
+        finally:
+            uses += 1
+            retire = uses >= self.recycle_after
+            if retire:
+                self._close(instance)
+            with self._available:
+                self.extractions += 1
+                if retire:
+                    self._created -= 1
+                    self.recycled += 1
+                else:
+                    self._idle.append((instance, uses))
+                self._available.notify()
+
+    def has_capacity(self) -> bool:
+        """Whether acquire() would return without waiting for another extraction to finish"""
+        with self._lock:
+            return bool(self._idle) or self._created < self.size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': self.size,
+                'instances': self._created,
+                'idle': len(self._idle),
+                'extractions': self.extractions,
+                'recycled': self.recycled
+            }
+
+# MARK: - Extractor Cache Directory
+
+YTDLP_CACHE_MAX_MB = int(os.environ.get('IZZY_YTDLP_CACHE_MB', 64))  # player JS + signature functions
+WARMUP_VIDEO_ID = 'jNQXAC9IVRw'  # Short, long-lived public video used to prime the player cache
+
+class ExtractorCacheDir:
+    """
+    Persistent, size-bounded yt-dlp cache directory (player JS, signature and n-parameter functions)
+    so extractions after the first run skip the player download and parsing
+    """
+
+    def __init__(self, path: Optional[str], max_bytes: int = YTDLP_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.pruned = 0
+
+    def _files(self) -> List[Tuple[str, int, float]]:
+        files = []
+        if not self.path:
+            return files
+        for root, _, names in os.walk(self.path):
+            for name in names:
+                file_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_path)
+                    files.append((file_path, stat.st_size, stat.st_mtime))
+                except OSError:
+                    continue
+        return files
+
+    def is_cold(self) -> bool:
+        return not self._files()
+
+    def prune(self):
+        """Delete least recently written files until the directory fits its size budget"""
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        for file_path, size, _ in sorted(files, key=lambda entry: entry[2]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(file_path)
+                total -= size
+                self.pruned += 1
+            except OSError:
+                continue
+
+    def stats(self) -> Dict[str, Any]:
+        files = self._files()
+        sections = {}
+        for file_path, _, _ in files:
+            section = os.path.relpath(os.path.dirname(file_path), self.path)
+            sections[section] = sections.get(section, 0) + 1
+        return {
+            'path': self.path,
+            'files': len(files),
+            'bytes': sum(size for _, size, _ in files),
+            'maxBytes': self.max_bytes,
+            'sections': sections,
+            'pruned': self.pruned
+        }
+
+def _open_extractor_cache() -> ExtractorCacheDir:
+    if not IS_SERVICE_PROCESS:
+        return ExtractorCacheDir(None)  # Workers get the cache path through their yt-dlp options
+    try:
+        return ExtractorCacheDir(get_data_dir('ytdlp-cache'))
+    except Exception as e:
+        logger.warning(f"yt-dlp cache directory unavailable, using yt-dlp defaults: {e}")
+        return ExtractorCacheDir(None)
+
+extractor_cache = _open_extractor_cache()
+
+# MARK: - Extraction Profiles
+
+# ⚡ 'audio_fast' asks YouTube for as little as possible; 'full' is the original full extraction
+EXTRACTION_PROFILE = os.environ.get('IZZY_EXTRACTION_PROFILE', 'audio_fast')
+FAST_PLAYER_CLIENTS = [c.strip() for c in os.environ.get('IZZY_FAST_PLAYER_CLIENTS', 'web_music').split(',') if c.strip()]
+
+EXTRACTION_PROFILES = {
+    'full': {
+        'options': {},
+        'process': True  # yt-dlp format sorting/selection
+    },
+    'audio_fast': {
+        'options': {
+            'extractor_args': {'youtube': {
+                'player_client': FAST_PLAYER_CLIENTS,  # One player request instead of several clients
+                'player_skip': ['webpage', 'configs'],  # No watch page / client config downloads
+                'skip': ['hls', 'dash', 'translated_subs']  # No manifests we never play
+            }},
+            'youtube_include_hls_manifest': False
+        },
+        'process': False  # We pick the audio format ourselves in one pass
+    }
+}
+
+# Direct (non-HLS/DASH) audio formats the fast paths accept: m4a 128k/48k, opus ~160k/~70k/~50k
+FAST_AUDIO_FORMATS = {'140': 'm4a', '139': 'm4a', '251': 'webm', '250': 'webm', '249': 'webm'}
+
+def profile_options(base_options: Dict[str, Any], profile: str) -> Dict[str, Any]:
+    """yt-dlp options for an extraction profile"""
+    return dict(base_options, **EXTRACTION_PROFILES[profile]['options'])
+
+def ytdlp_audio_candidates(formats: List[Dict[str, Any]], known_only: bool = False) -> List[Dict[str, Any]]:
+    """
+    Quality selector candidates from yt-dlp formats (processed or raw)
+    known_only keeps just the direct audio formats in FAST_AUDIO_FORMATS
+    """
+    candidates = []
+    for fmt in formats or []:
+        format_id = str(fmt.get('format_id', '')).split('-')[0]
+        if known_only and format_id not in FAST_AUDIO_FORMATS:
+            continue
+        if fmt.get('acodec') == 'none' or fmt.get('vcodec') not in (None, 'none'):
+            continue  # Video-only or muxed video
+        if 'm3u8' in str(fmt.get('protocol', '')) or 'dash' in str(fmt.get('protocol', '')):
+            continue  # Manifests, not a single playable URL
+        candidates.append({
+            'url': fmt.get('url'),
+            'formatId': format_id,
+            'bitrate': fmt.get('abr') or fmt.get('tbr'),
+            'codec': fmt.get('acodec'),
+            'container': FAST_AUDIO_FORMATS.get(format_id) or fmt.get('ext'),
+            'size': exact_content_length(fmt.get('filesize'), fmt.get('url')),
+            'approxSize': fmt.get('filesize_approx')
+        })
+    return candidates
+
+def exact_content_length(filesize: Any, url: Optional[str]) -> Optional[int]:
+    """
+    Exact byte count of a format: yt-dlp's filesize or the googlevideo `clen` URL parameter
+    (filesize_approx is a bitrate x duration estimate and must never be used as a Content-Length)
+    """
+    if filesize:
+        return int(filesize)
+    clen = (parse_qs(urlparse(url or '').query).get('clen') or [None])[0]
+    return int(clen) if clen and clen.isdigit() else None
+
+# Module-level counters are bumped from request, background lane and proxy threads
+_stats_lock = threading.Lock()
+
+def count_stat(stats: Dict[str, int], key: str, amount: int = 1):
+    """Increment a shared counter"""
+    with _stats_lock:
+        stats[key] += amount
+
+def stats_snapshot(stats: Dict[str, int]) -> Dict[str, int]:
+    """Consistent copy of a shared counter dict"""
+    with _stats_lock:
+        return dict(stats)
+
+extraction_profile_stats = {'fast': 0, 'fallback': 0}
+
+# ⚡ Try a single innertube player call before running yt-dlp at all - sent as the ANDROID_VR client,
+# whose responses carry plain audio URLs (no signature cipher, no n-parameter transform), so no player JS
+USE_DIRECT_PLAYER_RESOLVER = os.environ.get('IZZY_DIRECT_PLAYER_RESOLVER', '1') != '0'
+PLAYER_API_URL = 'https://www.youtube.com/youtubei/v1/player?prettyPrint=false'
+PLAYER_CLIENT_VERSION = '1.60.19'
+PLAYER_CLIENT_CONTEXT = {
+    'clientName': 'ANDROID_VR',
+    'clientVersion': PLAYER_CLIENT_VERSION,
+    'deviceMake': 'Oculus',
+    'deviceModel': 'Quest 3',
+    'androidSdkVersion': 32,
+    'osName': 'Android',
+    'osVersion': '12L',
+    'hl': 'en',
+    'gl': 'US'
+}
+PLAYER_CLIENT_HEADERS = {
+    'User-Agent': f'com.google.android.apps.youtube.vr.oculus/{PLAYER_CLIENT_VERSION} '
+                  '(Linux; U; Android 12L; eureka-user Build/SQ3A.220605.009.A1) gzip',
+    'X-YouTube-Client-Name': '28',
+    'X-YouTube-Client-Version': PLAYER_CLIENT_VERSION,
+    'Origin': 'https://www.youtube.com'
+}
+PLAYER_TIMEOUT = 10.0
+stream_resolver_stats = {'direct': 0, 'ytdlp': 0}
+stream_refresh_stats = {'warm': 0, 'cold': 0}
+
+# MARK: - Extraction Process Pool
+
+# ⚡ yt-dlp extraction is CPU-bound pure Python and holds the GIL - optionally run it in worker processes
+EXTRACTION_PROCESSES = int(os.environ.get('IZZY_EXTRACTION_PROCESSES', 0))  # 0 = extract in-process
+EXTRACTION_WORKER_MAX_JOBS = int(os.environ.get('IZZY_EXTRACTION_WORKER_MAX_JOBS', 50))  # jobs before recycling
+EXTRACTION_WORKER_MEMORY_MB = int(os.environ.get('IZZY_EXTRACTION_WORKER_MEMORY_MB', 400))  # peak RSS before recycling
+EXTRACTION_TIMEOUT = 60.0  # seconds - a worker that takes longer is killed
+
+# Only these info/format fields cross the process boundary (the full info dict is large to pickle)
+_SLIM_INFO_KEYS = ('id', 'title', 'duration', 'url', 'abr', 'ext', 'acodec', 'format_id', 'http_headers')
+_SLIM_FORMAT_KEYS = ('format_id', 'format_note', 'ext', 'container', 'acodec', 'vcodec', 'abr', 'tbr', 'asr',
+                     'audio_channels', 'filesize', 'filesize_approx', 'url', 'protocol', 'http_headers')
+
+def slim_info(info: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a yt-dlp info dict to the fields the stream code uses"""
+    slim = {key: info.get(key) for key in _SLIM_INFO_KEYS if key in info}
+    slim['formats'] = [{key: fmt.get(key) for key in _SLIM_FORMAT_KEYS if key in fmt}
+                       for fmt in info.get('formats') or []]
+    return slim
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KB on Linux
+    except Exception:
+        return 0.0
+
+def _extraction_worker(conn, options: Dict[str, Any], max_jobs: int, memory_limit_mb: int):
+    """
+    Worker process loop
+    Protocol: receives (job_id, url, profile) or None to stop; replies (job_id, ok, info or error, retiring)
+    and exits after replying with retiring=True (job limit or memory cap reached)
+    """
+    sys.stdout = sys.stderr  # stdout is the Swift protocol channel - never write to it here
+    instances = {}  # profile -> YoutubeDL
+    jobs = 0
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        job_id, url, profile = message
+        try:
+            ydl = instances.get(profile)
+            if ydl is None:
+                ydl = instances[profile] = YoutubeDL(profile_options(options, profile))
+            info = ydl.extract_info(url, download=False, process=EXTRACTION_PROFILES[profile]['process'])
+            payload, ok = slim_info(info), True
+        except Exception as e:
+            payload, ok = str(e), False
+        jobs += 1
+        retiring = jobs >= max_jobs or (memory_limit_mb > 0 and _peak_rss_mb() > memory_limit_mb)
+        conn.send((job_id, ok, payload, retiring))
+        if retiring:
+            break
+    conn.close()
+
+class ExtractionProcessPool:
+    """
+    Pool of long-lived yt-dlp worker processes talking over pipes
+    Each worker handles one job at a time; workers are replaced after a number of jobs,
+    when they exceed the memory cap, or when they crash or time out
+    """
+
+    def __init__(self, options: Dict[str, Any], size: int = EXTRACTION_PROCESSES,
+                 max_jobs: int = EXTRACTION_WORKER_MAX_JOBS, memory_limit_mb: int = EXTRACTION_WORKER_MEMORY_MB):
+        self.options = options
+        self.size = max(1, size)
+        self.max_jobs = max(1, max_jobs)
+        self.memory_limit_mb = memory_limit_mb
+        # spawn: forking a multi-threaded process is unsafe on macOS
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = []  # (process, connection)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)  # a worker went idle or a slot was freed
+        self._next_job = 0
+        self.jobs = 0
+        self.recycled = 0
+        self.failures = 0
+
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_extraction_worker, name='ytdlp-worker', daemon=True,
+                                        args=(child_conn, self.options, self.max_jobs, self.memory_limit_mb))
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _acquire(self):
+        """An idle worker, a newly spawned one while below the pool size, or the next one freed"""
+        with self._available:
+            while not self._idle and self._created >= self.size:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            return self._spawn()
+        except Exception:
+            with self._available:
+                self._created -= 1
+                self._available.notify()
+            raise
+
+    def _release(self, process, conn):
+        with self._available:
+            self._idle.append((process, conn))
+            self._available.notify()
+
+    def _retire(self, process, conn, kill: bool = False):
+        try:
+            if kill and process.is_alive():
+                process.kill()
+            conn.close()
+            process.join(timeout=1)
+        except Exception:
+            pass
+        with self._available:
+            self._created -= 1
+            self.recycled += 1
+            self._available.notify()  # A waiter spawns the replacement
+
+    def extract(self, url: str, profile: str = 'full') -> Dict[str, Any]:
+        """Run extract_info for `url` in a worker process and return the slimmed info dict"""
+        process, conn = self._acquire()
+        with self._lock:
+            self._next_job += 1
+            job_id = self._next_job
+        try:
+            conn.send((job_id, url, profile))
+            if not conn.poll(EXTRACTION_TIMEOUT):
+                raise TimeoutError(f"yt-dlp worker timed out after {EXTRACTION_TIMEOUT:.0f}s")
+            reply_id, ok, payload, retiring = conn.recv()
+            if reply_id != job_id:
+                raise Exception("yt-dlp worker replied out of order")
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            self._retire(process, conn, kill=True)
+            raise
+        
+        with self._lock:
+            self.jobs += 1
+        if retiring:
+            self._retire(process, conn)
+        else:
+            self._release(process, conn)
+        if not ok:
+            raise Exception(payload)
+        return payload
+
+    def shutdown(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                process, conn = self._idle.pop()
+            try:
+                conn.send(None)
+            except Exception:
+                pass
+            self._retire(process, conn)
+
+    def has_capacity(self) -> bool:
+        """Whether a job would start without waiting for another worker to free up"""
+        with self._lock:
+            return bool(self._idle) or self._created < self.size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': self.size,
+                'workers': self._created,
+                'jobs': self.jobs,
+                'recycled': self.recycled,
+                'failures': self.failures
+            }
+
 class YTMusicService:
     def __init__(self):
         try:
@@ -754,19 +2187,51 @@ class YTMusicService:
                     'writesubtitles': False,  # Don't download subtitles
                     'writeautomaticsub': False,  # Don't download auto-generated subs
                 }
+                # 🔋 Keep player JS and deciphered signatures in a persistent cache we manage
+                if extractor_cache.path:
+                    self.ydl_opts['cachedir'] = extractor_cache.path
+                
+                # Enhanced yt-dlp options for better audio quality
+                self.stream_opts = dict(self.ydl_opts, **{
+                    'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
+                    'prefer_free_formats': False,  # Prefer higher quality formats
+                    'youtube_include_dash_manifest': False,  # Avoid DASH for compatibility
+                })
+                self.ydl_pools = {profile: YoutubeDLPool(profile_options(self.stream_opts, profile))
+                                  for profile in EXTRACTION_PROFILES}
+            else:
+                self.ydl_pools = None
+            
+            # Optional multi-core extraction in worker processes
+            if HAS_YTDLP and EXTRACTION_PROCESSES > 0:
+                self.extraction_processes = ExtractionProcessPool(self.stream_opts)
+                atexit.register(self.extraction_processes.shutdown)
+            else:
+                self.extraction_processes = None
+            
+            # Hedged extraction workers and the last winning host per video type
+            self._extract_executor = ThreadPoolExecutor(max_workers=YTDLP_POOL_SIZE, thread_name_prefix='extract')
+            self._preferred_hosts = {}
+            
+            # How each recent stream was resolved (resolver, host, format) so refreshes skip the cold path
+            self._stream_contexts = OrderedDict()
+            self._stream_contexts_lock = threading.Lock()
+            
+            # 🔋 BATTERY OPTIMIZATION: One keep-alive session for direct player calls
+            self._player_session = requests.Session() if HAS_REQUESTS else None
             
         except Exception as e:
             logger.error(f"Failed to initialize YTMusicService: {e}")
             raise
     
-    def search_all(self, query: str, limit: int = 20) -> Dict[str, Any]:
+    def search_all(self, query: str, limit: int = 20, categories: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         Search across all categories: songs, albums, artists, playlists, videos
         """
         try:
             if HAS_YTMUSICAPI and self.yt:
                 print(f"Using ytmusicapi for search: {query}", file=sys.stderr)
-                results = self._search_with_ytmusicapi(query, limit)
+                results = self._search_with_ytmusicapi(query, limit, categories)
                 return {
                     'success': True,
                     'data': results  # Return the MusicSearchResults structure directly
@@ -787,12 +2252,13 @@ class YTMusicService:
                 'error': str(e)
             }
     
-    def _search_with_ytmusicapi(self, query: str, limit: int) -> Dict[str, Any]:
+    def _search_with_ytmusicapi(self, query: str, limit: int, categories: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         Search using ytmusicapi (preferred method)
         Enhanced with better error handling and search optimization
         """
-        results = {}
+        results = {category: [] for category in SEARCH_CATEGORIES}
+        wanted = normalize_categories(categories)
         
         # Search each category with proper ytmusicapi filters
         search_filters = {
@@ -804,9 +2270,19 @@ class YTMusicService:
         }
         
         for category, filter_name in search_filters.items():
+            if category not in wanted:
+                continue
             try:
                 print(f"Searching {category} for: '{query}' with filter '{filter_name}'", file=sys.stderr)
                 
+                if USE_FAST_SEARCH_PARSER:
+                    fast_results = self._search_with_innertube(query, filter_name, category, limit)
+                    count_stat(search_parser_stats, 'fast' if fast_results is not None else 'fallback')
+                    if fast_results is not None:
+                        results[category] = fast_results
+                        print(f"Parsed {len(fast_results)} {category} results (fast path)", file=sys.stderr)
+                        continue
+                
                 # Use ytmusicapi search with proper filter
                 search_results = self.yt.search(query, filter=filter_name, limit=limit)
                 print(f"Got {len(search_results)} {category} results", file=sys.stderr)
@@ -823,71 +2299,256 @@ class YTMusicService:
         
         return results
     
-    def _search_fallback(self, query: str, limit: int) -> Dict[str, Any]:
+    def _search_with_innertube(self, query: str, filter_name: str, category: str, limit: int) -> Optional[List[Dict]]:
         """
-        Fallback search method using basic YouTube search
+        Lean search: send the filtered innertube request and parse the raw response in one pass
+        Returns None whenever the response is not understood so the caller falls back to ytmusicapi
         """
         try:
-            # Create mock results for demonstration
-            # In a real implementation, you could use YouTube Data API or web scraping
-            # Use some real YouTube video IDs for testing (these are public domain/creative commons)
-            test_video_ids = [
-                'dQw4w9WgXcQ',  # Rick Astley - Never Gonna Give You Up
-                'kJQP7kiw5Fk',  # Luis Fonsi - Despacito
-                'JGwWNGJdvx8',  # Ed Sheeran - Shape of You
-                'fJ9rUzIMcZQ',  # Queen - Bohemian Rhapsody
-                'hTWKbfoikeg'   # Nirvana - Smells Like Teen Spirit
-            ]
+            body = {'query': query, 'params': get_search_params(filter_name, None, False)}
+            response = self.yt._send_request('search', body)
             
-            mock_results = {
-                'songs': [
-                    {
-                        'id': f'mock_song_{i}',
-                        'type': 'songs',
-                        'title': f'Test Song {i + 1} for "{query}"',
-                        'artist': 'Test Artist',
-                        'thumbnailURL': 'https://via.placeholder.com/120x120?text=Music',
-                        'duration': 180.0,
-                        'explicit': False,
-                        'videoId': test_video_ids[i % len(test_video_ids)],
-                        'browseId': None,
-                        'year': None,
-                        'playCount': None
-                    } for i in range(min(limit, 5))
-                ],
-                'albums': [],
-                'artists': [],
-                'playlists': [],
-                'videos': []
-            }
+            tabs = response['contents']['tabbedSearchResultsRenderer']['tabs']
+            sections = tabs[0]['tabRenderer']['content']['sectionListRenderer']['contents']
+            shelf = next((section['musicShelfRenderer'] for section in sections if 'musicShelfRenderer' in section), None)
+            if shelf is None:
+                return None
+            items = shelf.get('contents') or []
+            if len(items) < limit and shelf.get('continuations'):
+                return None  # More pages needed - ytmusicapi handles continuations
+            
+            formatted_results = []
+            for entry in items:
+                renderer = entry.get('musicResponsiveListItemRenderer')
+                parsed = self._parse_innertube_item(renderer, category) if renderer else None
+                if parsed is None:
+                    continue
+                record, album = parsed
+                formatted_results.append(record)
+                if category in ('songs', 'videos'):
+                    track_index.add(record, 'youtube_music', album=album)
+                if len(formatted_results) >= limit:
+                    break
             
-            return mock_results
+            if items and not formatted_results:
+                return None  # Layout changed - let ytmusicapi try
+            return formatted_results
             
         except Exception as e:
-            logger.error(f"Fallback search failed: {e}")
-            raise Exception(f"Fallback search failed: {str(e)}")
+            print(f"Fast search parser failed for {category}, falling back: {e}", file=sys.stderr)
+            return None
     
-    def _format_search_results(self, raw_results: List[Dict], category: str) -> List[Dict]:
+    def _parse_innertube_item(self, renderer: Dict, category: str) -> Optional[Tuple[Dict, Optional[str]]]:
         """
-        Format raw search results into consistent structure
+        Turn one musicResponsiveListItemRenderer from a filtered search straight into our track record
+        Returns (record, album name) or None when the item does not look like a search result
         """
-        formatted_results = []
+        title_runs = _text_runs(renderer, 0)
+        if not title_runs:
+            return None
+        title = ''.join(run.get('text', '') for run in title_runs).strip()
         
-        for item in raw_results:
-            try:
-                # Skip invalid items
-                if not item or not isinstance(item, dict):
-                    logger.warning(f"Skipping invalid item in {category}: {type(item)}")
-                    continue
-                    
-                formatted_item = self._format_single_result(item, category)
-                if formatted_item:
-                    formatted_results.append(formatted_item)
-            except Exception as e:
-                logger.error(f"Error formatting result in {category}: {e}")
+        video_id = (renderer.get('playlistItemData') or {}).get('videoId') \
+            or ((title_runs[0].get('navigationEndpoint') or {}).get('watchEndpoint') or {}).get('videoId')
+        browse_endpoint = (renderer.get('navigationEndpoint') or {}).get('browseEndpoint') or {}
+        browse_id = browse_endpoint.get('browseId')
+        
+        thumbnails = ((((renderer.get('thumbnail') or {}).get('musicThumbnailRenderer') or {})
+                       .get('thumbnail') or {}).get('thumbnails')) or []
+        thumbnail = max(thumbnails, key=lambda t: (t.get('width') or 0) * (t.get('height') or 0)) if thumbnails else None
+        
+        explicit = any(((badge.get('musicInlineBadgeRenderer') or {}).get('icon') or {}).get('iconType') == 'MUSIC_EXPLICIT_BADGE'
+                       for badge in renderer.get('badges') or [])
+        
+        # Subtitle column: groups separated by " • " - label, artists, album, year, duration, counts
+        artists, album, year, duration_text, count = [], None, None, None, None
+        plain_texts = []
+        for index, run in enumerate(_text_runs(renderer, 1)):
+            text = run.get('text', '').strip()
+            if not text or text in ('•', '&', ','):
                 continue
+            page_type = _run_page_type(run)
+            if page_type in ('MUSIC_PAGE_TYPE_ARTIST', 'MUSIC_PAGE_TYPE_USER_CHANNEL'):
+                artists.append(text)
+            elif page_type == 'MUSIC_PAGE_TYPE_ALBUM':
+                album = text
+            elif _DURATION_PATTERN.match(text):
+                duration_text = text
+            elif _YEAR_PATTERN.match(text):
+                year = text
+            elif text.lower().endswith(_COUNT_SUFFIXES):
+                count = text
+            elif not (index == 0 and text.lower() in _SEARCH_ITEM_LABELS):
+                plain_texts.append(text)
         
-        return formatted_results
+        if duration_text is None:
+            fixed_columns = renderer.get('fixedColumns') or []
+            if fixed_columns:
+                fixed_runs = ((fixed_columns[0].get('musicResponsiveListItemFixedColumnRenderer') or {}).get('text') or {}).get('runs') or []
+                fixed_text = fixed_runs[0].get('text', '') if fixed_runs else ''
+                if _DURATION_PATTERN.match(fixed_text):
+                    duration_text = fixed_text
+        
+        if not artists and plain_texts and category in ('songs', 'videos', 'albums'):
+            artists = [plain_texts[0]]  # Unlinked artist names
+        
+        if category in ('songs', 'videos'):
+            if not video_id or not title:
+                return None
+        elif not browse_id:
+            return None
+        
+        record = {
+            'id': video_id or browse_id,
+            'type': category,
+            'title': title,
+            'artist': ', '.join(artists) if artists else None,
+            'thumbnailURL': thumbnail.get('url') if thumbnail else None,
+            'duration': None,
+            'explicit': explicit,
+            'videoId': video_id,
+            'browseId': browse_id,
+            'year': year if category in ('songs', 'albums') else None,
+            'playCount': count if category in ('artists', 'videos') else None
+        }
+        if category == 'artists':
+            record['artist'] = title
+        elif category == 'playlists':
+            record['artist'] = plain_texts[0] if plain_texts else (artists[0] if artists else None)
+        if duration_text and category in ('songs', 'videos'):
+            record['duration'] = self._parse_duration(duration_text)
+        return record, album
+    
+    def get_top_result(self, query: str) -> Dict[str, Any]:
+        """
+        Get the single best playable match for a query
+        Uses the "Top result" block of an unfiltered search, falling back to the first song hit
+        """
+        try:
+            if not HAS_YTMUSICAPI or not self.yt:
+                return {
+                    'success': False,
+                    'error': 'ytmusicapi not available - top result not supported'
+                }
+            
+            results = [r for r in self.yt.search(query, limit=1) if isinstance(r, dict) and r.get('videoId')]
+            top_item = next((r for r in results if r.get('category') == 'Top result'), None)
+            if top_item is None:
+                top_item = next((r for r in results if r.get('resultType') in ('song', 'video')), None)
+            if top_item is None:
+                songs = self.yt.search(query, filter='songs', limit=1)
+                top_item = songs[0] if songs else None
+            
+            category = 'videos' if top_item and top_item.get('resultType') == 'video' else 'songs'
+            top_result = self._format_single_result(top_item, category) if top_item else None
+            if not top_result:
+                return {
+                    'success': False,
+                    'error': 'No top result found'
+                }
+            
+            return {
+                'success': True,
+                'data': top_result
+            }
+            
+        except Exception as e:
+            logger.error(f"Failed to get top result: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def get_search_suggestions(self, query: str) -> Dict[str, Any]:
+        """
+        Get autocomplete suggestions for a partial query from YouTube Music
+        """
+        try:
+            if not HAS_YTMUSICAPI or not self.yt:
+                return {
+                    'success': False,
+                    'error': 'ytmusicapi not available - search suggestions not supported'
+                }
+            
+            suggestions = self.yt.get_search_suggestions(query)
+            
+            return {
+                'success': True,
+                'data': [s for s in suggestions if isinstance(s, str)]
+            }
+            
+        except Exception as e:
+            logger.error(f"Failed to get search suggestions: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def _search_fallback(self, query: str, limit: int) -> Dict[str, Any]:
+        """
+        Fallback search method using basic YouTube search
+        """
+        try:
+            # Create mock results for demonstration
+            # In a real implementation, you could use YouTube Data API or web scraping
+            # Use some real YouTube video IDs for testing (these are public domain/creative commons)
+            test_video_ids = [
+                'dQw4w9WgXcQ',  # Rick Astley - Never Gonna Give You Up
+                'kJQP7kiw5Fk',  # Luis Fonsi - Despacito
+                'JGwWNGJdvx8',  # Ed Sheeran - Shape of You
+                'fJ9rUzIMcZQ',  # Queen - Bohemian Rhapsody
+                'hTWKbfoikeg'   # Nirvana - Smells Like Teen Spirit
+            ]
+            
+            mock_results = {
+                'songs': [
+                    {
+                        'id': f'mock_song_{i}',
+                        'type': 'songs',
+                        'title': f'Test Song {i + 1} for "{query}"',
+                        'artist': 'Test Artist',
+                        'thumbnailURL': 'https://via.placeholder.com/120x120?text=Music',
+                        'duration': 180.0,
+                        'explicit': False,
+                        'videoId': test_video_ids[i % len(test_video_ids)],
+                        'browseId': None,
+                        'year': None,
+                        'playCount': None
+                    } for i in range(min(limit, 5))
+                ],
+                'albums': [],
+                'artists': [],
+                'playlists': [],
+                'videos': []
+            }
+            
+            return mock_results
+            
+        except Exception as e:
+            logger.error(f"Fallback search failed: {e}")
+            raise Exception(f"Fallback search failed: {str(e)}")
+    
+    def _format_search_results(self, raw_results: List[Dict], category: str) -> List[Dict]:
+        """
+        Format raw search results into consistent structure
+        """
+        formatted_results = []
+        
+        for item in raw_results:
+            try:
+                # Skip invalid items
+                if not item or not isinstance(item, dict):
+                    logger.warning(f"Skipping invalid item in {category}: {type(item)}")
+                    continue
+                    
+                formatted_item = self._format_single_result(item, category)
+                if formatted_item:
+                    formatted_results.append(formatted_item)
+            except Exception as e:
+                logger.error(f"Error formatting result in {category}: {e}")
+                continue
+        
+        return formatted_results
     
     def _format_single_result(self, item: Dict, category: str) -> Optional[Dict]:
         """
@@ -1053,6 +2714,10 @@ class YTMusicService:
                 if views:
                     result['playCount'] = views
             
+            # Remember every track we have seen for offline local search
+            if category in ('songs', 'videos') and result['videoId']:
+                track_index.add(result, 'youtube_music', album=safe_get(safe_get(item, 'album', None), 'name', None))
+            
             return result
             
         except Exception as e:
@@ -1082,14 +2747,22 @@ class YTMusicService:
         
         return None
     
-    def get_stream_info(self, video_id: str) -> Dict[str, Any]:
+    def get_stream_info(self, video_id: str, quality_policy: Optional[str] = None) -> Dict[str, Any]:
         """
         Extract stream URL and metadata for a video ID using yt-dlp or fallback
         """
         try:
+            if USE_DIRECT_PLAYER_RESOLVER and self._player_session is not None:
+                direct_response = self._get_stream_with_player(video_id, quality_policy)
+                if direct_response is not None:
+                    count_stat(stream_resolver_stats, 'direct')
+                    self._remember_stream_context(video_id, None, direct_response['data'])
+                    return direct_response
+            
             if HAS_YTDLP:
                 print(f"Using yt-dlp for stream extraction: {video_id}", file=sys.stderr)
-                return self._get_stream_with_ytdlp(video_id)
+                count_stat(stream_resolver_stats, 'ytdlp')
+                return self._get_stream_with_ytdlp(video_id, quality_policy)
             else:
                 print(f"yt-dlp not available, using fallback for: {video_id}", file=sys.stderr)
                 return self._get_stream_fallback(video_id)
@@ -1101,95 +2774,280 @@ class YTMusicService:
                 'error': f"Stream extraction failed: {str(e)}"
             }
     
-    def _get_stream_with_ytdlp(self, video_id: str) -> Dict[str, Any]:
+    def _remember_stream_context(self, video_id: str, host: Optional[str], data: Dict[str, Any]):
+        with self._stream_contexts_lock:
+            self._stream_contexts[video_id] = {
+                'resolver': data.get('resolver'),
+                'host': host,
+                'formatId': data.get('formatId'),
+                'contentLength': data.get('contentLength')
+            }
+            self._stream_contexts.move_to_end(video_id)
+            while len(self._stream_contexts) > STREAM_CACHE_SIZE:
+                self._stream_contexts.popitem(last=False)
+    
+    def stream_context(self, video_id: str) -> Dict[str, Any]:
+        """How the last stream for this video was resolved (empty when unknown)"""
+        with self._stream_contexts_lock:
+            return dict(self._stream_contexts.get(video_id) or {})
+    
+    def refresh_stream_info(self, video_id: str, quality_policy: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Re-resolve a stream whose URL expired, aiming for the format it was playing:
+        one direct player call first, then (if that does not offer the format) a single minimal
+        extraction on the host that won last time - still one yt-dlp extract_info call, but with
+        no hedging and no second host; falls back to the full get_stream_info path otherwise
+        """
+        context = self.stream_context(video_id)
+        resolver = context.get('resolver')
+        
+        def offers_format(response: Optional[Dict[str, Any]]) -> bool:
+            formats = ((response or {}).get('data') or {}).get('formats') or []
+            return bool(response and response.get('success')) and \
+                any(fmt.get('formatId') == context.get('formatId') for fmt in formats)
+        
+        try:
+            response = None
+            if resolver and USE_DIRECT_PLAYER_RESOLVER and self._player_session is not None:
+                response = self._get_stream_with_player(video_id, quality_policy)
+            if not offers_format(response) and resolver in EXTRACTION_PROFILES and context.get('host') and HAS_YTDLP:
+                profile = 'audio_fast' if context.get('formatId') in FAST_AUDIO_FORMATS else resolver
+                response = self._extract_stream_from_url(f"https://{context['host']}/watch?v={video_id}",
+                                                         profile, quality_policy)
+            if offers_format(response):
+                count_stat(stream_refresh_stats, 'warm')
+                self._remember_stream_context(video_id, context.get('host'), response['data'])
+                return response
+        except Exception as e:
+            print(f"Warm stream refresh failed for {video_id}, using full resolution: {e}", file=sys.stderr)
+        count_stat(stream_refresh_stats, 'cold')
+        return self.get_stream_info(video_id, quality_policy)
+    
+    def _get_stream_with_player(self, video_id: str, quality_policy: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Lean resolver: one innertube player call as the ANDROID_VR client (ytmusicapi's _send_request
+        always sends its own WEB_REMIX context, whose URLs need the player JS)
+        Returns None when the response is unusable (not playable, or only ciphered formats) so the
+        caller falls back to yt-dlp
+        """
+        try:
+            body = {
+                'context': {'client': PLAYER_CLIENT_CONTEXT},
+                'videoId': video_id,
+                'contentCheckOk': True,
+                'racyCheckOk': True
+            }
+            http_response = self._player_session.post(PLAYER_API_URL, json=body, headers=PLAYER_CLIENT_HEADERS,
+                                                      timeout=PLAYER_TIMEOUT)
+            if http_response.status_code != 200:
+                return None
+            response = http_response.json()
+            
+            if (response.get('playabilityStatus') or {}).get('status') != 'OK':
+                return None
+            
+            candidates = []
+            for fmt in (response.get('streamingData') or {}).get('adaptiveFormats') or []:
+                url = fmt.get('url')
+                format_id = str(fmt.get('itag', ''))
+                if not url or format_id not in FAST_AUDIO_FORMATS:
+                    continue  # signatureCipher entries need deciphering
+                codecs = re.search(r'codecs="([^"]+)"', fmt.get('mimeType', ''))
+                candidates.append({
+                    'url': url,
+                    'formatId': format_id,
+                    'bitrate': round(fmt['bitrate'] / 1000, 1) if fmt.get('bitrate') else None,
+                    'codec': codecs.group(1) if codecs else None,
+                    'container': FAST_AUDIO_FORMATS[format_id],
+                    'size': int(fmt['contentLength']) if fmt.get('contentLength') else None
+                })
+            
+            details = response.get('videoDetails') or {}
+            duration = int(details.get('lengthSeconds') or 0)
+            best_format = select_audio_format(candidates, quality_policy, duration)
+            if not best_format:
+                return None
+            
+            print(f"Resolved stream directly from player endpoint: {video_id}", file=sys.stderr)
+            quality = best_format.get('bitrate')
+            return {
+                'success': True,
+                'data': audio_stream_data(best_format, details.get('title', ''), duration,
+                                          str(quality) if quality is not None else 'unknown', quality_policy, candidates,
+                                          'player')
+            }
+            
+        except Exception as e:
+            print(f"Direct player resolver failed for {video_id}: {e}", file=sys.stderr)
+            return None
+    
+    def _get_stream_with_ytdlp(self, video_id: str, quality_policy: Optional[str] = None) -> Dict[str, Any]:
         """
         Extract stream using yt-dlp (preferred method)
         Enhanced with better audio quality selection and error handling
+        ⚡ The music.youtube.com and www.youtube.com variants are raced (hedged)
         """
-        # Try both YouTube Music and regular YouTube URLs
-        urls_to_try = [
-            f"https://music.youtube.com/watch?v={video_id}",
-            f"https://www.youtube.com/watch?v={video_id}"
-        ]
+        if not HAS_YTDLP or YoutubeDL is None or self.ydl_pools is None:
+            raise Exception("yt-dlp is not available")
         
-        # Enhanced yt-dlp options for better audio quality
-        enhanced_opts = {
-            'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
-            'quiet': True,
-            'no_warnings': True,
-            'extractaudio': True,
-            'audioformat': 'best',
-            'noplaylist': True,
-            'no_check_certificate': True,
-            'prefer_free_formats': False,  # Prefer higher quality formats
-            'youtube_include_dash_manifest': False,  # Avoid DASH for compatibility
-        }
+        # Try both YouTube Music and regular YouTube URLs, last winning host for this kind of video first
+        video_type = (track_index.get_track('youtube_music', video_id) or {}).get('type', 'unknown')
+        hosts = list(STREAM_EXTRACTION_HOSTS)
+        preferred_host = self._preferred_hosts.get(video_type)
+        if preferred_host in hosts:
+            hosts.remove(preferred_host)
+            hosts.insert(0, preferred_host)
+        urls_to_try = [f"https://{host}/watch?v={video_id}" for host in hosts]
         
         last_error = None
+        hedge_delay = extraction_latency.hedge_delay()
+        
+        if hedge_delay < 0:
+            # Hedging disabled - try each URL in turn
+            for url in urls_to_try:
+                try:
+                    started = time.monotonic()
+                    response = self._extract_stream_from_url(url, quality_policy=quality_policy)
+                    extraction_latency.record(time.monotonic() - started)
+                    self._remember_stream_context(video_id, urlparse(url).netloc, response['data'])
+                    return response
+                except Exception as e:
+                    last_error = e
+                    print(f"Failed to extract from {url}: {e}", file=sys.stderr)
+            raise Exception(f"Stream extraction failed for all URLs. Last error: {last_error}")
+        
+        # Start the preferred host now and the other after the hedge delay (or at once if it fails)
+        # A hedge that is already extracting when the other host wins cannot be stopped - it runs to
+        # completion and its cost (an extractor slot, bandwidth) is still paid; attempts that have not
+        # reached an extractor yet see `settled` and return without extracting
+        settled = threading.Event()
+        
+        def attempt(url: str) -> Dict[str, Any]:
+            if settled.is_set():
+                raise Exception("Stream already resolved by another host")
+            return self._extract_stream_from_url(url, None, quality_policy)
+        
+        pending = {}
+        remaining = list(urls_to_try)
+        url = remaining.pop(0)
+        started = {}  # future -> start time, so only the winner's own extraction time is recorded
+        future = self._extract_executor.submit(attempt, url)
+        pending[future], started[future] = url, time.monotonic()
+        hedge_skipped = False
+        
+        while pending:
+            timeout = hedge_delay if remaining and not hedge_skipped else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    print(f"Failed to extract from {url}: {e}", file=sys.stderr)
+                    continue
+                # Winner - remember its host; a slower attempt still running is left to finish
+                settled.set()
+                extraction_latency.record(time.monotonic() - started[future])
+                self._preferred_hosts[video_type] = urlparse(url).netloc
+                self._remember_stream_context(video_id, urlparse(url).netloc, response['data'])
+                return response
+            if remaining and (not done or not pending):
+                if pending and not self._extractor_available():
+                    # Every extractor is busy - a hedge would only queue behind them, so keep waiting
+                    print(f"Skipping hedged extraction for {video_id}: no idle extractor", file=sys.stderr)
+                    extraction_latency.count_hedge(skipped=True)
+                    hedge_skipped = True
+                    continue
+                # Hedge delay elapsed or the first attempt failed - start the next host
+                url = remaining.pop(0)
+                print(f"Hedging stream extraction with: {url}", file=sys.stderr)
+                if pending:
+                    extraction_latency.count_hedge()
+                future = self._extract_executor.submit(attempt, url)
+                pending[future], started[future] = url, time.monotonic()
+        
+        # If we get here, all URLs failed
+        raise Exception(f"Stream extraction failed for all URLs. Last error: {last_error}")
+    
+    def _extractor_available(self) -> bool:
+        """Whether an extraction could start now (an idle or creatable worker / YoutubeDL instance)"""
+        if self.extraction_processes is not None:
+            return self.extraction_processes.has_capacity()
+        pool = (self.ydl_pools or {}).get(EXTRACTION_PROFILE)
+        return pool is not None and pool.has_capacity()
+    
+    def _extract_stream_from_url(self, url: str, profile: Optional[str] = None,
+                                 quality_policy: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Run one yt-dlp extraction for a watch URL and pick the audio stream for the quality policy
+        """
+        print(f"Trying to extract stream from: {url}", file=sys.stderr)
         
-        for url in urls_to_try:
+        profile = profile or EXTRACTION_PROFILE
+        if profile == 'audio_fast':
+            # ⚡ Minimal extraction over the known direct audio formats; full extraction if that fails
             try:
-                print(f"Trying to extract stream from: {url}", file=sys.stderr)
-                
-                if not HAS_YTDLP or YoutubeDL is None:
-                    raise Exception("yt-dlp is not available")
-                
-                with YoutubeDL(enhanced_opts) as ydl:
-                    info = ydl.extract_info(url, download=False)
-                    
-                    # Extract the best audio stream URL
-                    stream_url = info.get('url')
-                    if not stream_url:
-                        # Try formats if direct URL not available
-                        formats = info.get('formats', [])
-                        audio_formats = [f for f in formats if f.get('acodec') != 'none']
-                        if audio_formats:
-                            # Get the best quality audio format (prefer m4a, then webm, then others)
-                            def format_priority(fmt):
-                                ext = fmt.get('ext', '')
-                                abr = fmt.get('abr', 0)
-                                if ext == 'm4a':
-                                    return (3, abr)
-                                elif ext == 'webm':
-                                    return (2, abr)
-                                else:
-                                    return (1, abr)
-                            
-                            best_format = max(audio_formats, key=format_priority)
-                            stream_url = best_format.get('url')
-                    
-                    if not stream_url:
-                        raise Exception("No valid stream URL found")
-                    
-                    # Convert quality to string to match Swift expectations
-                    quality = info.get('abr')
-                    if quality is None:
-                        # Try to get quality from format
-                        formats = info.get('formats', [])
-                        if formats:
-                            quality = formats[0].get('abr')
-                    
-                    quality_str = str(quality) if quality is not None else 'unknown'
-                    
-                    print(f"Successfully extracted stream: quality={quality_str}, duration={info.get('duration', 0)}", file=sys.stderr)
-                    
+                info = self._extract_info(url, 'audio_fast')
+                candidates = ytdlp_audio_candidates(info.get('formats'), known_only=True)
+                best_format = select_audio_format(candidates, quality_policy, info.get('duration') or 0)
+                if best_format:
+                    count_stat(extraction_profile_stats, 'fast')
+                    quality = best_format.get('bitrate')
                     return {
                         'success': True,
-                        'data': {
-                            'url': stream_url,
-                            'title': info.get('title', ''),
-                            'duration': info.get('duration', 0),
-                            'quality': quality_str
-                        }
+                        'data': audio_stream_data(best_format, info.get('title', ''), info.get('duration', 0),
+                                                  str(quality) if quality is not None else 'unknown', quality_policy,
+                                                  candidates, 'audio_fast')
                     }
-                    
+                print("Fast extraction found no acceptable audio format, using full extraction", file=sys.stderr)
             except Exception as e:
-                last_error = e
-                print(f"Failed to extract from {url}: {e}", file=sys.stderr)
-                continue
+                print(f"Fast extraction failed, using full extraction: {e}", file=sys.stderr)
+            count_stat(extraction_profile_stats, 'fallback')
         
-        # If we get here, all URLs failed
-        raise Exception(f"Stream extraction failed for all URLs. Last error: {last_error}")
+        info = self._extract_info(url)
+        
+        # Pick from all audio formats (m4a preferred over webm); yt-dlp's own pick if it only gave one URL
+        candidates = ytdlp_audio_candidates(info.get('formats'))
+        best_format = select_audio_format(candidates, quality_policy, info.get('duration') or 0)
+        if not best_format and info.get('url'):
+            candidates = [{
+                'url': info['url'],
+                'formatId': info.get('format_id'),
+                'bitrate': info.get('abr') or info.get('tbr'),
+                'codec': info.get('acodec'),
+                'container': info.get('ext'),
+                'size': exact_content_length(info.get('filesize'), info['url']),
+                'approxSize': info.get('filesize_approx')
+            }]
+            best_format = select_audio_format(candidates, quality_policy, info.get('duration') or 0)
+        
+        if not best_format:
+            raise Exception("No valid stream URL found")
+        
+        # Convert quality to string to match Swift expectations
+        quality = best_format.get('bitrate')
+        quality_str = str(quality) if quality is not None else 'unknown'
+        
+        print(f"Successfully extracted stream: quality={quality_str}, duration={info.get('duration', 0)}", file=sys.stderr)
+        
+        return {
+            'success': True,
+            'data': audio_stream_data(best_format, info.get('title', ''), info.get('duration', 0), quality_str, quality_policy,
+                                      candidates, 'full')
+        }
+    
+    def _extract_info(self, url: str, profile: str = 'full') -> Dict[str, Any]:
+        """
+        Run yt-dlp's extract_info for a URL - in a worker process when the extraction
+        process pool is enabled, otherwise on a pooled in-process YoutubeDL instance
+        """
+        if self.extraction_processes is not None:
+            return self.extraction_processes.extract(url, profile)
+        
+        # Reuse a pooled YoutubeDL instance (extractors, options and session already set up)
+        with self.ydl_pools[profile].acquire() as ydl:
+            return ydl.extract_info(url, download=False, process=EXTRACTION_PROFILES[profile]['process'])
     
     def _get_stream_fallback(self, video_id: str) -> Dict[str, Any]:
         """
@@ -1524,67 +3382,1869 @@ class YTMusicService:
                 'error': str(e)
             }
 
-def handle_request(request_data: Dict[str, Any]) -> Dict[str, Any]:
+# MARK: - Response Output
+
+_stdout_lock = threading.Lock()
+
+def emit_response(response: Dict[str, Any]):
     """
-    Handle incoming requests from Swift
+    Write a single JSON response line to stdout (safe to call from any thread)
+    """
+    line = json.dumps(response)
+    with _stdout_lock:
+        print(line, flush=True)
+
+# MARK: - Request Handling
+
+# 🔋 BATTERY OPTIMIZATION: Service instances (and their HTTP sessions) are reused across requests
+_services: Dict[str, Any] = {}
+_services_lock = threading.Lock()
+
+def get_service(music_source: str):
+    """
+    Return the shared service instance for a music source, creating it on first use
+    Raises ValueError for a source the service does not know
+    """
+    if music_source not in MERGED_SEARCH_SOURCES:
+        raise ValueError(f"Unknown music source: {music_source}")
+    with _services_lock:
+        service = _services.get(music_source)
+        if service is None:
+            service = JioSaavnService() if music_source == 'jiosaavn' else YTMusicService()
+            _services[music_source] = service
+        return service
+
+def cached_search(service, music_source: str, query: str, limit: int, categories: Optional[List[str]] = None,
+                  provisional: bool = False, request_id: Any = None) -> Dict[str, Any]:
+    """
+    Run a search through the shared search cache
+    With `provisional`, a query extending a recently searched prefix first gets locally
+    filtered results emitted as a provisional response, then the upstream result is returned
+    """
+    key = SearchCache.make_key(music_source, query, limit, categories)
+    cached_results = search_cache.get(key)
+    if cached_results is not None:
+        print(f"⚡ Search cache hit for: '{query}'", file=sys.stderr)
+        return {
+            'success': True,
+            'data': cached_results,
+            'cached': True
+        }
+    
+    if provisional:
+        prefix_match = prefix_index.lookup(music_source, query)
+        if prefix_match is not None:
+            cached_query, prefix_results = prefix_match
+            print(f"⚡ Provisional results for '{query}' from prefix '{cached_query}'", file=sys.stderr)
+            provisional_response = {
+                'success': True,
+                'data': filter_results_for_query(prefix_results, query, limit),
+                'provisional': True
+            }
+            if request_id is not None:
+                provisional_response['requestId'] = request_id
+            emit_response(provisional_response)
+    
+    response = service.search_all(query, limit, categories)
+    # Only cache searches that produced something - empty results are often transient upstream errors
+    if response.get('success') and any(response.get('data', {}).values()):
+        search_cache.put(key, response['data'])
+        prefix_index.add(music_source, query, response['data'])
+        remember_search(query, response['data'])
+    return response
+
+# The full search running beside a top-result lookup gets its own worker: in "all" mode it is a
+# merged search that fans out on _search_executor, so sharing that pool could deadlock
+_top_result_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='top-result-search')
+
+def search_with_top_result(service, music_source: str, query: str, run_search, request_id: Any = None,
+                           quality_policy: Optional[str] = None) -> Dict[str, Any]:
     """
+    Emit the best match with a speculatively resolved stream as soon as it is known,
+    while the full categorised search runs concurrently; returns the full search response
+    """
+    full_search = _top_result_executor.submit(run_search)
+    
     try:
-        # Get the music source from the request (default to YouTube Music)
-        music_source = request_data.get('musicSource', 'youtube_music')
-        print(f"🎵 Python received musicSource: '{music_source}'", file=sys.stderr)
-        
-        if music_source == 'jiosaavn':
-            print("🔥 Using JioSaavn service", file=sys.stderr)
-            service = JioSaavnService()
+        top_response = service.get_top_result(query)
+        if top_response.get('success'):
+            top_result = top_response['data']
+            stream_response = resolve_stream(service, music_source, top_result.get('videoId') or top_result.get('id'),
+                                             quality_policy)
+            top_response = {
+                'success': True,
+                'data': {
+                    'result': dict(top_result, source=music_source),
+                    'stream': without_format_ladder(stream_response).get('data') if stream_response.get('success') else None
+                },
+                'topResult': True
+            }
         else:
-            print("🔥 Using YouTube Music service", file=sys.stderr)
-            service = YTMusicService()
-            
-        action = request_data.get('action')
-        print(f"🎵 Action: {action}", file=sys.stderr)
-        
-        if action == 'search':
-            query = request_data.get('query', '')
-            limit = request_data.get('limit', 20)
-            return service.search_all(query, limit)
-            
-        elif action == 'stream':
-            video_id = request_data.get('videoId', '')
-            return service.get_stream_info(video_id)
-            
-        elif action == 'album_tracks':
-            browse_id = request_data.get('browseId', '')
-            return service.get_album_tracks(browse_id)
-            
-        elif action == 'playlist_tracks':
-            playlist_id = request_data.get('playlistId', '')
-            return service.get_playlist_tracks(playlist_id)
-            
-        elif action == 'artist_songs':
-            browse_id = request_data.get('browseId', '')
-            return service.get_artist_songs(browse_id)
-            
-        elif action == 'watch_playlist':
-            video_id = request_data.get('videoId', '')
-            playlist_id = request_data.get('playlistId')  # Optional
-            return service.get_watch_playlist(video_id, playlist_id)
-            
-        elif action == 'song_suggestions':
-            video_id = request_data.get('videoId', '')
-            return service.get_song_suggestions(video_id)
-            
-        elif action == 'lyrics':
-            video_id = request_data.get('videoId', '')
-            return service.get_lyrics(video_id)
-            
-        elif action == 'mood_categories':
-            return service.get_mood_categories()
-            
-        elif action == 'mood_playlists':
-            params = request_data.get('params', '')
-            return service.get_mood_playlists(params)
-            
-        elif action == 'charts':
+            top_response['topResult'] = True
+        if request_id is not None:
+            top_response['requestId'] = request_id
+        emit_response(top_response)
+    except Exception as e:
+        logger.error(f"Top result lookup failed: {e}")
+    
+    return full_search.result()
+
+def stream_cache_id(video_id: str, quality_policy: Optional[str] = None) -> str:
+    """Stream cache ID - streams picked under a non-default quality policy are cached separately"""
+    policy = normalize_quality_policy(quality_policy)
+    return video_id if policy == QUALITY_POLICY else f"{video_id}@{policy}"
+
+def resolve_stream(service, music_source: str, video_id: str, quality_policy: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Resolve stream info through the expiry-aware stream cache
+    """
+    cache_id = stream_cache_id(video_id, quality_policy)
+    cached_stream = stream_cache.get(music_source, cache_id)
+    if cached_stream is not None:
+        print(f"⚡ Stream cache hit for: {video_id}", file=sys.stderr)
+        return {
+            'success': True,
+            'data': cached_stream,
+            'cached': True
+        }
+    
+    response = service.get_stream_info(video_id, quality_policy)
+    if response.get('success') and response.get('data'):
+        stream_cache.put(music_source, cache_id, response['data'])
+    return response
+
+STREAM_BATCH_CONCURRENCY = int(os.environ.get('IZZY_STREAM_BATCH_CONCURRENCY', 3))  # extractions at once
+
+def resolve_streams(service, music_source: str, video_ids: List[str], concurrency: Optional[int] = None,
+                    progressive: bool = False, request_id: Any = None,
+                    quality_policy: Optional[str] = None, include_formats: bool = False) -> Dict[str, Any]:
+    """
+    Resolve stream info for many tracks concurrently (bounded by a concurrency cap)
+    Cache hits are answered first; with `progressive` every item is also emitted as soon as it is ready
+    """
+    unique_ids = list(dict.fromkeys(v for v in video_ids or [] if v))
+    results = {}
+    
+    def finish(video_id: str, response: Dict[str, Any]):
+        if not include_formats:
+            response = without_format_ladder(response)
+        item = {'videoId': video_id, 'success': bool(response.get('success'))}
+        if item['success']:
+            item['data'] = response.get('data')
+            item['cached'] = bool(response.get('cached'))
+        else:
+            item['error'] = response.get('error', 'Unknown error')
+        results[video_id] = item
+        if progressive:
+            event = {'success': True, 'event': 'stream', 'data': item}
+            if request_id is not None:
+                event['requestId'] = request_id
+            emit_response(event)
+    
+    to_resolve = []
+    for video_id in unique_ids:
+        cached_stream = stream_cache.get(music_source, stream_cache_id(video_id, quality_policy))
+        if cached_stream is not None:
+            finish(video_id, {'success': True, 'data': cached_stream, 'cached': True})
+        else:
+            to_resolve.append(video_id)
+    
+    if to_resolve:
+        workers = max(1, min(concurrency or STREAM_BATCH_CONCURRENCY, STREAM_BATCH_CONCURRENCY, len(to_resolve)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='streams') as executor:
+            futures = {executor.submit(resolve_stream, service, music_source, video_id, quality_policy): video_id for video_id in to_resolve}
+            for future in as_completed(futures):
+                try:
+                    response = future.result()
+                except Exception as e:
+                    response = {'success': False, 'error': str(e)}
+                finish(futures[future], response)
+    
+    return {
+        'success': True,
+        'data': [results[video_id] for video_id in unique_ids]
+    }
+
+def refresh_stream(service, music_source: str, video_id: str, quality_policy: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Replace a cached stream whose URL expired or was rejected, reusing the service's extraction
+    context (resolver, host, format) when it has one
+    """
+    cache_id = stream_cache_id(video_id, quality_policy)
+    stream_cache.invalidate(music_source, cache_id)
+    if hasattr(service, 'refresh_stream_info'):
+        response = service.refresh_stream_info(video_id, quality_policy)
+    else:
+        response = service.get_stream_info(video_id, quality_policy)
+    if response.get('success') and response.get('data'):
+        stream_cache.put(music_source, cache_id, response['data'])
+    return response
+
+def resolve_pinned_format(music_source: str, video_id: str, policy: Optional[str] = None,
+                          format_id: Optional[str] = None, fresh: bool = False) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Resolve a track and return (format ladder entry, stream data) for `format_id`, or for the
+    policy's pick when no format is pinned yet - byte offsets stay valid across re-resolves
+    `fresh` refreshes the stream first (the upstream URL was rejected)
+    """
+    if fresh:
+        response = refresh_stream(get_service(music_source), music_source, video_id, policy)
+    else:
+        response = resolve_stream(get_service(music_source), music_source, video_id, policy)
+    if not response.get('success'):
+        raise Exception(response.get('error', 'Stream resolution failed'))
+    data = response['data']
+    format_id = format_id or data.get('formatId')
+    for fmt in data.get('formats') or [data]:
+        if fmt.get('formatId') == format_id and fmt.get('url'):
+            return fmt, data
+    raise Exception(f"Format {format_id} is no longer offered for {video_id}")
+
+# MARK: - Local Audio Proxy
+
+# ⚡ Optional localhost server giving each track a stable URL - expired upstream URLs are re-resolved
+# and resumed at the same byte offset, and a bounded read-ahead buffer absorbs slow CDN edges
+AUDIO_PROXY_ENABLED = os.environ.get('IZZY_AUDIO_PROXY', '0') == '1'  # Also per request with 'proxy': true
+AUDIO_PROXY_PORT = int(os.environ.get('IZZY_AUDIO_PROXY_PORT', 0))  # 0 = any free port
+AUDIO_PROXY_CHUNK = 64 * 1024
+AUDIO_PROXY_READAHEAD = int(os.environ.get('IZZY_AUDIO_PROXY_READAHEAD_KB', 1024)) * 1024  # per connection
+AUDIO_PROXY_RETRIES = 3  # upstream re-resolves per connection before giving up
+AUDIO_PROXY_TIMEOUT = 15.0
+AUDIO_PROXY_MAX_TRACKS = 64
+AUDIO_CONTENT_TYPES = {'m4a': 'audio/mp4', 'mp4': 'audio/mp4', 'webm': 'audio/webm'}
+
+class UpstreamExpired(Exception):
+    """The upstream URL was rejected (expired or revoked) and has to be re-resolved"""
+
+class ProxyTrack:
+    """
+    Proxy state for one track: the format pinned at first resolution (so byte offsets stay
+    valid across re-resolves), its total length and content type
+    """
+
+    def __init__(self, source: str, video_id: str, policy: str):
+        self.source = source
+        self.video_id = video_id
+        self.policy = policy
+        self.format_id = None
+        self.container = None
+        self.meta = {}
+        self.total_length = None
+        self.content_type = None
+        self.lock = threading.Lock()
+
+class _AudioProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.server.audio_proxy.serve(self, head=True)
+
+    def do_GET(self):
+        self.server.audio_proxy.serve(self)
+
+    def log_message(self, format, *args):
+        pass  # Player range requests would flood stderr
+
+class AudioProxy:
+    """
+    Localhost HTTP server exposing resolved tracks as /stream/<source>/<id>?q=<qualityPolicy>
+    Supports Range requests; each connection is fed by an upstream reader thread through a bounded buffer
+    """
+
+    def __init__(self):
+        self._server = None
+        self._tracks = OrderedDict()  # (source, id, policy) -> ProxyTrack
+        self._lock = threading.Lock()
+        self.counts = {'connections': 0, 'bytesServed': 0, 'reResolves': 0, 'failures': 0}  # via count_stat
+
+    def ensure_started(self) -> str:
+        """Start the server on first use; returns its base URL"""
+        with self._lock:
+            if self._server is None:
+                self._server = ThreadingHTTPServer(('127.0.0.1', AUDIO_PROXY_PORT), _AudioProxyHandler)
+                self._server.daemon_threads = True
+                self._server.audio_proxy = self
+                threading.Thread(target=self._server.serve_forever, name='audio-proxy', daemon=True).start()
+                print(f"⚡ Audio proxy listening on port {self._server.server_address[1]}", file=sys.stderr)
+            return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def local_url(self, source: str, video_id: str, policy: Optional[str] = None) -> str:
+        return (f"{self.ensure_started()}/stream/{quote(source, safe='')}/{quote(video_id, safe='')}"
+                f"?q={quote(normalize_quality_policy(policy), safe='')}")
+
+    def proxied(self, response: Dict[str, Any], source: str, video_id: str, policy: Optional[str] = None) -> Dict[str, Any]:
+        """Point a successful stream response at the proxy, keeping the CDN URL as upstreamUrl"""
+        if not response.get('success') or not isinstance(response.get('data'), dict):
+            return response
+        data = dict(response['data'], upstreamUrl=response['data'].get('url'),
+                    url=self.local_url(source, video_id, policy))
+        return dict(response, data=data)
+
+    def _track(self, source: str, video_id: str, policy: str) -> ProxyTrack:
+        key = (source, video_id, policy)
+        with self._lock:
+            track = self._tracks.get(key)
+            if track is None:
+                track = ProxyTrack(source, video_id, policy)
+                self._tracks[key] = track
+                while len(self._tracks) > AUDIO_PROXY_MAX_TRACKS:
+                    self._tracks.popitem(last=False)
+            self._tracks.move_to_end(key)
+            return track
+
+    def _upstream_url(self, track: ProxyTrack, fresh: bool = False) -> str:
+        """
+        Upstream URL for the track's pinned format, from the stream cache unless `fresh`
+        """
+        fmt, data = resolve_pinned_format(track.source, track.video_id, track.policy, track.format_id, fresh)
+        with track.lock:
+            track.format_id = fmt.get('formatId')
+            track.meta = {'formatId': fmt.get('formatId'), 'bitrate': fmt.get('bitrate'), 'quality': data.get('quality'),
+                          'title': data.get('title', ''), 'duration': data.get('duration', 0)}
+            track.container = track.container or fmt.get('container')
+            if track.total_length is None and fmt.get('contentLength'):
+                track.total_length = int(fmt['contentLength'])
+            if track.content_type is None:
+                track.content_type = AUDIO_CONTENT_TYPES.get(fmt.get('container'))
+        return fmt['url']
+
+    def _open(self, track: ProxyTrack, start: int, end: Optional[int], fresh: bool = False):
+        """Open an upstream ranged GET, re-resolving once if the URL was rejected"""
+        url = self._upstream_url(track, fresh)
+        byte_range = f"bytes={start}-{end if end is not None else ''}"
+        upstream = requests.get(url, headers={'Range': byte_range}, stream=True, timeout=AUDIO_PROXY_TIMEOUT)
+        if upstream.status_code in (401, 403, 404, 410):
+            upstream.close()
+            raise UpstreamExpired(f"HTTP {upstream.status_code}")
+        if upstream.status_code not in (200, 206) or (upstream.status_code == 200 and start > 0):
+            upstream.close()
+            raise Exception(f"Upstream did not honour the range request: HTTP {upstream.status_code}")
+        
+        with track.lock:
+            content_range = upstream.headers.get('Content-Range', '')
+            if '/' in content_range and not content_range.endswith('*'):
+                track.total_length = int(content_range.rsplit('/', 1)[1])  # Authoritative over the format ladder
+            elif track.total_length is None and upstream.status_code == 200 and upstream.headers.get('Content-Length'):
+                track.total_length = int(upstream.headers['Content-Length'])
+            if track.content_type is None:
+                track.content_type = upstream.headers.get('Content-Type')
+        return upstream
+
+    def _ensure_length(self, track: ProxyTrack):
+        """Learn the total length (from the format ladder, else a one-byte upstream probe)"""
+        if track.total_length is None:
+            self._upstream_url(track)
+        if track.total_length is None:
+            try:
+                upstream = self._open(track, 0, 0)
+            except UpstreamExpired:
+                count_stat(self.counts, 'reResolves')
+                upstream = self._open(track, 0, 0, fresh=True)
+            upstream.close()
+        if track.total_length is None:
+            raise Exception('Upstream did not report a content length')
+
+    @staticmethod
+    def _put(chunks: queue.Queue, item: Any, stop: threading.Event) -> bool:
+        """Hand an item to the client writer, giving up once it has gone away (False)"""
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=1.0)  # Blocks while the read-ahead buffer is full
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _pump(self, track: ProxyTrack, start: int, end: int, chunks: queue.Queue, stop: threading.Event):
+        """
+        Upstream reader: fills the bounded read-ahead buffer, re-resolving and resuming
+        at the current offset when the URL expires or the connection drops
+        """
+        offset, attempts, fresh = start, 0, False
+        while offset <= end and not stop.is_set():
+            try:
+                with self._open(track, offset, end, fresh) as upstream:
+                    for chunk in upstream.iter_content(AUDIO_PROXY_CHUNK):
+                        if not self._put(chunks, chunk, stop):
+                            return
+                        offset += len(chunk)
+                        attempts, fresh = 0, False
+                if offset <= end:
+                    raise Exception(f"Upstream closed early at byte {offset}")
+            except Exception as e:
+                attempts += 1
+                if attempts > AUDIO_PROXY_RETRIES:
+                    self._put(chunks, e, stop)
+                    return
+                fresh = isinstance(e, UpstreamExpired) or attempts > 1
+                if fresh:
+                    count_stat(self.counts, 'reResolves')
+                print(f"⚡ Audio proxy resuming {track.video_id} at byte {offset}: {e}", file=sys.stderr)
+        self._put(chunks, None, stop)
+
+    def serve(self, handler: BaseHTTPRequestHandler, head: bool = False):
+        count_stat(self.counts, 'connections')
+        try:
+            path = urlparse(handler.path)
+            parts = path.path.strip('/').split('/')
+            if len(parts) != 3 or parts[0] != 'stream':
+                handler.send_error(404)
+                return
+            source, video_id = unquote(parts[1]), unquote(parts[2])
+            if source not in MERGED_SEARCH_SOURCES:
+                handler.send_error(404)
+                return
+            policy = normalize_quality_policy((parse_qs(path.query).get('q') or [None])[0])
+            track = self._track(source, video_id, policy)
+            self._ensure_length(track)
+        except Exception as e:
+            count_stat(self.counts, 'failures')
+            print(f"Audio proxy could not resolve {handler.path}: {e}", file=sys.stderr)
+            handler.send_error(502)
+            return
+        
+        total = track.total_length
+        start, end = 0, total - 1
+        byte_range = re.match(r'bytes=(\d*)-(\d*)$', handler.headers.get('Range', '').strip())
+        if byte_range and (byte_range.group(1) or byte_range.group(2)):
+            if byte_range.group(1):
+                start = int(byte_range.group(1))
+                end = min(int(byte_range.group(2)), total - 1) if byte_range.group(2) else total - 1
+            else:
+                start = max(0, total - int(byte_range.group(2)))  # Suffix range: the last N bytes
+            if start > end:
+                handler.send_response(416)
+                handler.send_header('Content-Range', f"bytes */{total}")
+                handler.send_header('Content-Length', '0')
+                handler.end_headers()
+                return
+        
+        handler.send_response(206 if byte_range else 200)
+        handler.send_header('Content-Type', track.content_type or 'application/octet-stream')
+        handler.send_header('Accept-Ranges', 'bytes')
+        handler.send_header('Content-Length', str(end - start + 1))
+        if byte_range:
+            handler.send_header('Content-Range', f"bytes {start}-{end}/{total}")
+        handler.end_headers()
+        if head:
+            return
+        
+        # ⚡ Bytes already held in memory go out first while upstream connects for the rest
+        held = prefetched_bytes.covering(track.source, track.video_id, track.format_id, start) or b''
+        held = held[:end - start + 1]
+        prefetched_bytes.count_served(len(held))
+        
+        chunks = queue.Queue(maxsize=max(1, AUDIO_PROXY_READAHEAD // AUDIO_PROXY_CHUNK))
+        stop = threading.Event()
+        if start + len(held) <= end:
+            threading.Thread(target=self._pump, args=(track, start + len(held), end, chunks, stop),
+                             name='audio-proxy-upstream', daemon=True).start()
+        else:
+            chunks.put(None)
+        
+        # 🔋 A whole-file transfer is written to the audio store on the way through
+        store_file, part_path = None, None
+        if start == 0 and end == total - 1 and audio_store.begin(track.source, track.video_id):
+            try:
+                part_path = audio_store.part_path(track.source, track.video_id, track.format_id, track.container)
+                store_file = open(part_path, 'wb')
+            except OSError:
+                audio_store.end(track.source, track.video_id)
+        
+        try:
+            if held:
+                handler.wfile.write(held)
+                count_stat(self.counts, 'bytesServed', len(held))
+                if store_file is not None:
+                    store_file.write(held)
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                handler.wfile.write(chunk)
+                count_stat(self.counts, 'bytesServed', len(chunk))
+                if store_file is not None:
+                    store_file.write(chunk)
+            if store_file is not None:
+                store_file.close()
+                store_file = None
+                audio_store.commit(track.source, track.video_id, part_path, total, track.meta)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Player seeked or stopped
+        except Exception as e:
+            count_stat(self.counts, 'failures')
+            print(f"Audio proxy stream failed for {track.video_id}: {e}", file=sys.stderr)
+            handler.close_connection = True
+        finally:
+            stop.set()
+            if part_path is not None:
+                if store_file is not None:
+                    store_file.close()  # Incomplete - the .part file is left for a resumed fetch
+                audio_store.end(track.source, track.video_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': AUDIO_PROXY_ENABLED,
+                'running': self._server is not None,
+                'port': self._server.server_address[1] if self._server is not None else None,
+                'tracks': len(self._tracks),
+                **stats_snapshot(self.counts)
+            }
+
+audio_proxy = AudioProxy()
+
+# MARK: - Audio Store
+
+# 🔋 BATTERY OPTIMIZATION: Frequently played tracks are kept on disk so replays need no network at all
+AUDIO_CACHE_MAX_MB = int(os.environ.get('IZZY_AUDIO_CACHE_MB', 1024))  # 0 disables the audio store
+AUDIO_CACHE_MIN_PLAYS = int(os.environ.get('IZZY_AUDIO_CACHE_MIN_PLAYS', 2))  # plays before a background fetch
+AUDIO_CACHE_FILL_INTERVAL = 60  # seconds between idle checks for deferred popular-track fills
+AUDIO_CACHE_MAX_DEFERRED = 50
+AUDIO_CACHE_PLAY_BONUS = 86400.0  # seconds of recency each play is worth when choosing what to evict
+AUDIO_CACHE_VERIFY_AGE = 7 * 86400.0  # re-hash entries not verified for this long
+AUDIO_CACHE_VERIFY_BATCH = 20  # entries re-hashed per idle run
+AUDIO_CACHE_SAVE_DELAY = 30.0
+AUDIO_FETCH_CHUNK = 256 * 1024
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class AudioStore:
+    """
+    Size-bounded on-disk audio cache keyed by (source, track ID)
+    Entries are written through a .part file, checked for the exact length and hashed on commit;
+    lookups re-check the size and an idle task re-hashes old entries. Eviction is LRU where each
+    play counts as extra recency (AUDIO_CACHE_PLAY_BONUS), so favourites outlive one-off plays
+    """
+
+    def __init__(self, path: Optional[str], max_bytes: int = AUDIO_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes if path else 0
+        self._entries = {}  # 'source:id' -> entry
+        self._fetching = set()
+        self._now_playing = None  # (source, id, policy) of the last streamed track
+        self._deferred = OrderedDict()  # 'source:id' -> (source, id, policy) waiting for a background fill
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._save_timer = None
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+        self.corrupt = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def _key(source: str, track_id: str) -> str:
+        return f"{source}:{track_id}"
+
+    @staticmethod
+    def _file_stem(key: str) -> str:
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+    def part_path(self, source: str, track_id: str, format_id: Optional[str], container: Optional[str]) -> str:
+        """
+        Partial download path - the format is part of the name so a resumed transfer never
+        appends bytes of one format to a file started with another (itag 140 and 139 are both m4a)
+        """
+        stem = self._file_stem(self._key(source, track_id))
+        safe_format = re.sub(r'[^A-Za-z0-9]+', '_', str(format_id or 'default'))
+        return os.path.join(self.path, f"{stem}-{safe_format}.{container or 'audio'}.part")
+
+    def discard_other_parts(self, source: str, track_id: str, keep: str):
+        """Delete leftover partial downloads of this track in other formats"""
+        stem = self._file_stem(self._key(source, track_id))
+        try:
+            names = os.listdir(self.path)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.path, name)
+            if name.startswith(stem) and name.endswith('.part') and path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    # Persistence
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        index_path = os.path.join(self.path, 'index.json') if self.path else None
+        if not index_path or not os.path.exists(index_path):
+            return
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f).get('entries', {})
+            print(f"💾 Loaded audio store with {len(self._entries)} tracks", file=sys.stderr)
+        except Exception as e:
+            logger.warning(f"Could not load audio store index: {e}")
+
+    def _schedule_save(self):
+        if not self.path or self._save_timer is not None:
+            return
+        self._save_timer = threading.Timer(AUDIO_CACHE_SAVE_DELAY, self.save)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def save(self):
+        with self._lock:
+            self._save_timer = None
+            if not self.path or not self._loaded:
+                return
+            entries = dict(self._entries)
+        try:
+            write_json_atomic(os.path.join(self.path, 'index.json'), {'version': 1, 'entries': entries})
+        except Exception as e:
+            logger.warning(f"Could not save audio store index: {e}")
+
+    # Lookup
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            try:
+                os.remove(entry['file'])
+            except OSError:
+                pass
+            self._schedule_save()
+
+    def get(self, source: str, track_id: str) -> Optional[Dict[str, Any]]:
+        """The stored entry when its file is present and complete (counts as a use)"""
+        if not self.enabled:
+            return None
+        key = self._key(source, track_id)
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            try:
+                intact = os.path.getsize(entry['file']) == entry['size']
+            except OSError:
+                intact = False
+            if not intact:
+                self.corrupt += 1
+                self.misses += 1
+                self._drop(key)
+                return None
+            entry['lastUsed'] = time.time()
+            entry['plays'] = entry.get('plays', 0) + 1
+            self.hits += 1
+            self._schedule_save()
+            return dict(entry)
+
+    def contains(self, source: str, track_id: str) -> bool:
+        with self._lock:
+            self._ensure_loaded()
+            return self._key(source, track_id) in self._entries
+
+    def peek(self, source: str, track_id: str) -> Optional[Dict[str, Any]]:
+        """The stored entry without counting a use or checking the file"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(self._key(source, track_id))
+            return dict(entry) if entry is not None else None
+
+    def stream_response(self, source: str, track_id: str) -> Optional[Dict[str, Any]]:
+        """A stream response pointing at the local file, or None when the track is not stored"""
+        entry = self.get(source, track_id)
+        if entry is None:
+            return None
+        print(f"💾 Audio store hit for: {track_id}", file=sys.stderr)
+        return {
+            'success': True,
+            'data': {
+                'url': 'file://' + quote(entry['file']),
+                'title': entry.get('title', ''),
+                'duration': entry.get('duration', 0),
+                'quality': entry.get('quality', 'unknown'),
+                'formatId': entry.get('formatId'),
+                'bitrate': entry.get('bitrate'),
+                'estimatedSize': entry['size'],
+                'local': True
+            },
+            'cached': True
+        }
+
+    # Filling
+
+    def begin(self, source: str, track_id: str) -> bool:
+        """Claim a track for writing - False when it is already stored or being written"""
+        if not self.enabled:
+            return False
+        key = self._key(source, track_id)
+        with self._lock:
+            self._ensure_loaded()
+            if key in self._entries or key in self._fetching:
+                return False
+            self._fetching.add(key)
+            return True
+
+    def end(self, source: str, track_id: str):
+        with self._lock:
+            self._fetching.discard(self._key(source, track_id))
+
+    def commit(self, source: str, track_id: str, part_path: str, size: int, meta: Dict[str, Any]) -> bool:
+        """
+        Move a completed .part file into the store after checking its length and hashing it
+        """
+        try:
+            if os.path.getsize(part_path) != size:
+                raise Exception(f"expected {size} bytes, found {os.path.getsize(part_path)}")
+            digest = file_sha256(part_path)
+            key = self._key(source, track_id)
+            file_path = part_path[:-len('.part')]
+            os.replace(part_path, file_path)
+        except Exception as e:
+            print(f"💾 Not storing {track_id}: {e}", file=sys.stderr)
+            try:
+                os.remove(part_path)
+            except OSError:
+                pass
+            return False
+        
+        now = time.time()
+        with self._lock:
+            self._ensure_loaded()
+            previous = self._entries.get(key) or {}
+            self._entries[key] = {
+                'source': source,
+                'id': track_id,
+                'file': file_path,
+                'size': size,
+                'sha256': digest,
+                'formatId': meta.get('formatId'),
+                'bitrate': meta.get('bitrate'),
+                'quality': meta.get('quality', 'unknown'),
+                'title': meta.get('title', ''),
+                'duration': meta.get('duration', 0),
+                'plays': previous.get('plays', 0),
+                'pinned': bool(meta.get('pinned') or previous.get('pinned')),
+                'lastUsed': now,
+                'verifiedAt': now
+            }
+            self.stored += 1
+            self._evict()
+            self._schedule_save()
+            kept = key in self._entries
+        print(f"💾 Stored {track_id} ({size} bytes)" if kept else f"💾 {track_id} does not fit the audio store budget",
+              file=sys.stderr)
+        return kept
+
+    def pin(self, source: str, track_id: str) -> bool:
+        """Keep a stored track out of eviction; False when it is not stored"""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(self._key(source, track_id))
+            if entry is None:
+                return False
+            entry['pinned'] = True
+            self._schedule_save()
+            return True
+
+    def remove(self, source: str, track_id: str) -> bool:
+        with self._lock:
+            self._ensure_loaded()
+            key = self._key(source, track_id)
+            if key not in self._entries:
+                return False
+            self._drop(key)
+            return True
+
+    def pinned_bytes(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return sum(entry['size'] for entry in self._entries.values() if entry.get('pinned'))
+
+    def _evict(self):
+        # Pinned (offline) tracks have their own budget (DOWNLOAD_MAX_MB) - this one covers the cache
+        total = sum(entry['size'] for entry in self._entries.values() if not entry.get('pinned'))
+        by_value = sorted([item for item in self._entries.items() if not item[1].get('pinned')],
+                          key=lambda item: item[1].get('lastUsed', 0) + item[1].get('plays', 0) * AUDIO_CACHE_PLAY_BONUS)
+        for key, entry in by_value:
+            if total <= self.max_bytes:
+                break
+            total -= entry['size']
+            self._drop(key)
+            self.evicted += 1
+
+    def fetch(self, source: str, track_id: str, policy: Optional[str] = None, progress=None,
+              yield_to_interactive: bool = False, pin: bool = False) -> bool:
+        """
+        Download a track into the store with resumable Range requests (a leftover .part file is
+        continued, an expired URL is re-resolved for the same format)
+        progress(received, total) is called per chunk; returns True once the track is stored
+        Pinned tracks (offline downloads) are never evicted
+        """
+        if not self.enabled or not HAS_REQUESTS:
+            return False
+        if not self.begin(source, track_id):
+            return self.pin(source, track_id) if pin else self.contains(source, track_id)
+        try:
+            fmt, data = resolve_pinned_format(source, track_id, policy)
+            part_path = self.part_path(source, track_id, fmt.get('formatId'), fmt.get('container'))
+            self.discard_other_parts(source, track_id, keep=part_path)
+            received = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            total = fmt.get('contentLength')
+            attempts, fresh = 0, False
+            
+            while total is None or received < total:
+                if yield_to_interactive and background_lane.should_yield():
+                    return False  # The .part file is resumed next time
+                try:
+                    if fresh:
+                        fmt, data = resolve_pinned_format(source, track_id, policy, fmt.get('formatId'), fresh=True)
+                    before = received
+                    upstream = requests.get(fmt['url'], headers={'Range': f"bytes={received}-"}, stream=True,
+                                            timeout=AUDIO_PROXY_TIMEOUT)
+                    with upstream:
+                        if upstream.status_code in (401, 403, 404, 410):
+                            raise UpstreamExpired(f"HTTP {upstream.status_code}")
+                        if upstream.status_code == 416:
+                            reported = re.match(r'bytes \*/(\d+)', upstream.headers.get('Content-Range', ''))
+                            if (reported and int(reported.group(1)) == received) or (total is None and not reported):
+                                total = received  # The .part file already holds everything
+                                break
+                            received = 0  # The .part file is longer than the track - start over
+                            raise Exception('Requested range not satisfiable')
+                        if upstream.status_code == 200:
+                            received = 0  # Range ignored - start over
+                        elif upstream.status_code != 206:
+                            raise Exception(f"HTTP {upstream.status_code}")
+                        content_range = upstream.headers.get('Content-Range', '')
+                        if '/' in content_range and not content_range.endswith('*'):
+                            total = int(content_range.rsplit('/', 1)[1])
+                        elif upstream.status_code == 200 and upstream.headers.get('Content-Length'):
+                            total = int(upstream.headers['Content-Length'])
+                        
+                        with open(part_path, 'ab' if received else 'wb') as f:
+                            for chunk in upstream.iter_content(AUDIO_FETCH_CHUNK):
+                                f.write(chunk)
+                                received += len(chunk)
+                                attempts, fresh = 0, False
+                                if progress is not None:
+                                    progress(received, total)
+                                if yield_to_interactive and background_lane.should_yield():
+                                    return False
+                    if received == before and received != total:
+                        raise Exception('Upstream sent no data')
+                    if total is None:
+                        total = received  # No length reported - the server closed at the end
+                except Exception as e:
+                    attempts += 1
+                    if attempts > AUDIO_PROXY_RETRIES:
+                        raise
+                    fresh = isinstance(e, UpstreamExpired) or attempts > 1
+                    print(f"💾 Resuming download of {track_id} at byte {received}: {e}", file=sys.stderr)
+            
+            return self.commit(source, track_id, part_path, total, {
+                'pinned': pin,
+                'formatId': fmt.get('formatId'),
+                'bitrate': fmt.get('bitrate'),
+                'quality': data.get('quality') if data.get('formatId') == fmt.get('formatId') else str(fmt.get('bitrate')),
+                'title': data.get('title', ''),
+                'duration': data.get('duration', 0)
+            })
+        except Exception as e:
+            print(f"💾 Could not fetch {track_id} into the audio store: {e}", file=sys.stderr)
+            return False
+        finally:
+            self.end(source, track_id)
+
+    def track_started(self, source: str, track_id: str, policy: Optional[str] = None):
+        """
+        A track started streaming - the previous one has finished (or was skipped), so it may now be
+        filled into the store without downloading it a second time while the player streams it
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            previous, self._now_playing = self._now_playing, (source, track_id, policy)
+            if previous is not None and previous[:2] != (source, track_id):
+                self._deferred[self._key(*previous[:2])] = previous
+                while len(self._deferred) > AUDIO_CACHE_MAX_DEFERRED:
+                    self._deferred.popitem(last=False)
+
+    def fill_deferred(self):
+        """
+        Idle task: store finished tracks that have been played often enough
+        🔋 Only on mains power - on battery the track is simply streamed again next time
+        """
+        if not self.enabled or not on_mains_power():
+            return
+        while not background_lane.should_yield():
+            with self._lock:
+                if not self._deferred:
+                    return
+                _, (source, track_id, policy) = self._deferred.popitem(last=False)
+            self.fetch_if_popular(source, track_id, policy)
+
+    def fetch_if_popular(self, source: str, track_id: str, policy: Optional[str] = None):
+        """Store a track once it has been played often enough"""
+        if track_index.play_count(source, track_id) >= AUDIO_CACHE_MIN_PLAYS and not self.contains(source, track_id):
+            self.fetch(source, track_id, policy, yield_to_interactive=True)
+
+    def verify(self):
+        """Idle task: re-hash entries that have not been verified recently and drop corrupt ones"""
+        with self._lock:
+            self._ensure_loaded()
+            cutoff = time.time() - AUDIO_CACHE_VERIFY_AGE
+            due = [key for key, entry in self._entries.items() if entry.get('verifiedAt', 0) < cutoff][:AUDIO_CACHE_VERIFY_BATCH]
+        for key in due:
+            if background_lane.should_yield():
+                return
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                continue
+            try:
+                intact = file_sha256(entry['file']) == entry['sha256']
+            except OSError:
+                intact = False
+            with self._lock:
+                if not intact:
+                    self.corrupt += 1
+                    self._drop(key)
+                elif key in self._entries:
+                    self._entries[key]['verifiedAt'] = time.time()
+                    self._schedule_save()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                'enabled': self.enabled,
+                'tracks': len(self._entries),
+                'pinned': sum(1 for entry in self._entries.values() if entry.get('pinned')),
+                'bytes': sum(entry['size'] for entry in self._entries.values()),
+                'pinnedBytes': sum(entry['size'] for entry in self._entries.values() if entry.get('pinned')),
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stored': self.stored,
+                'evicted': self.evicted,
+                'corrupt': self.corrupt,
+                'fetching': len(self._fetching),
+                'deferredFills': len(self._deferred)
+            }
+
+def _open_audio_store() -> AudioStore:
+    if not IS_SERVICE_PROCESS:
+        return AudioStore(None)
+    try:
+        return AudioStore(get_data_dir('audio') if AUDIO_CACHE_MAX_MB > 0 else None)
+    except Exception as e:
+        logger.warning(f"Audio store unavailable: {e}")
+        return AudioStore(None)
+
+audio_store = _open_audio_store()
+if IS_SERVICE_PROCESS:
+    atexit.register(audio_store.save)
+
+# MARK: - Offline Downloads
+
+DOWNLOAD_CONCURRENCY = int(os.environ.get('IZZY_DOWNLOAD_CONCURRENCY', 4))  # tracks transferred at once
+DOWNLOAD_MAX_MB = int(os.environ.get('IZZY_DOWNLOAD_MAX_MB', 8192))  # budget for pinned (offline) tracks
+DOWNLOAD_PROGRESS_STEP = 0.1  # emit a progress event every 10% per track
+DOWNLOAD_JOBS_KEPT = 20  # finished jobs still answerable by download_status
+
+class DownloadManager:
+    """
+    Offline downloads as background jobs: `download` returns a job ID at once and the job runs off
+    the request loop, so searches and streams are never blocked; `download_status` reports progress
+    Jobs run one at a time, each fetching its tracks into the audio store (pinned) with bounded
+    parallelism and resumable transfers, within the DOWNLOAD_MAX_MB budget for pinned tracks
+    """
+
+    def __init__(self, max_bytes: int = DOWNLOAD_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._jobs = OrderedDict()  # job ID -> job
+        self._lock = threading.Lock()  # guards jobs, their track items and the budget reservation
+        self._reserved = 0  # bytes claimed by transfers in flight, not yet counted as pinned
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='download-job')
+        self._next_id = 0
+
+    def start(self, service, music_source: str, album_id: Optional[str] = None, playlist_id: Optional[str] = None,
+              video_ids: Optional[List[str]] = None, quality_policy: Optional[str] = None,
+              concurrency: Optional[int] = None, progressive: bool = False, request_id: Any = None) -> Dict[str, Any]:
+        """Queue a download job; with `progressive`, per-track events tagged with the job ID are emitted"""
+        if not audio_store.enabled or not HAS_REQUESTS:
+            return {
+                'success': False,
+                'error': 'Offline downloads need the audio store (IZZY_AUDIO_CACHE_MB) and the requests library'
+            }
+        with self._lock:
+            self._next_id += 1
+            job = {
+                'jobId': f"download-{self._next_id}",
+                'status': 'queued',
+                'source': music_source,
+                'tracks': OrderedDict(),
+                'budgetExceeded': False,
+                'error': None,
+                'created': time.time()
+            }
+            self._jobs[job['jobId']] = job
+            finished = [job_id for job_id, other in self._jobs.items() if other['status'] in ('done', 'failed')]
+            for job_id in finished[:max(0, len(finished) - DOWNLOAD_JOBS_KEPT)]:
+                del self._jobs[job_id]
+        self._executor.submit(self._run, job, service, album_id, playlist_id, video_ids, quality_policy,
+                              concurrency, progressive, request_id)
+        return {
+            'success': True,
+            'data': {'jobId': job['jobId'], 'status': 'queued'}
+        }
+
+    def _emit(self, job: Dict[str, Any], item: Dict[str, Any], progressive: bool, request_id: Any):
+        if progressive:
+            event = {'success': True, 'event': 'download', 'data': dict(item, jobId=job['jobId'])}
+            if request_id is not None:
+                event['requestId'] = request_id
+            emit_response(event)
+
+    def _run(self, job: Dict[str, Any], service, album_id, playlist_id, video_ids, quality_policy,
+             concurrency, progressive, request_id):
+        try:
+            with self._lock:
+                job['status'] = 'running'
+            music_source = job['source']
+            track_ids = list(video_ids or [])
+            for listing_id, get_tracks in ((album_id, service.get_album_tracks), (playlist_id, service.get_playlist_tracks)):
+                if not listing_id:
+                    continue
+                listing = get_tracks(listing_id)
+                if not listing.get('success'):
+                    raise Exception(listing.get('error', 'Could not list tracks'))
+                track_ids.extend(track.get('videoId') for track in listing.get('data') or [])
+            track_ids = list(dict.fromkeys(v for v in track_ids if v))
+            with self._lock:
+                for video_id in track_ids:
+                    job['tracks'][video_id] = {'videoId': video_id, 'status': 'queued'}
+            
+            def download(video_id: str) -> Dict[str, Any]:
+                with self._lock:
+                    item = job['tracks'][video_id]
+                already_stored = audio_store.contains(music_source, video_id)
+                expected = 0
+                if not already_stored:
+                    fmt, _ = resolve_pinned_format(music_source, video_id, quality_policy)
+                    expected = fmt.get('contentLength') or fmt.get('estimatedSize') or 0
+                    if not self._reserve(expected):
+                        with self._lock:
+                            job['budgetExceeded'] = True
+                        return {'videoId': video_id, 'status': 'skipped', 'error': 'Offline download budget exceeded'}
+                
+                reported = [0.0]
+                
+                def progress(received: int, total: Optional[int]):
+                    with self._lock:
+                        item.update(status='downloading', received=received, total=total)
+                        snapshot = dict(item)
+                    fraction = received / total if total else 0.0
+                    if fraction - reported[0] >= DOWNLOAD_PROGRESS_STEP:
+                        reported[0] = fraction
+                        self._emit(job, snapshot, progressive, request_id)
+                
+                try:
+                    stored = audio_store.fetch(music_source, video_id, quality_policy, progress, pin=True)
+                finally:
+                    self._release(expected)
+                if stored:
+                    entry = audio_store.peek(music_source, video_id) or {}
+                    return {'videoId': video_id, 'status': 'stored', 'size': entry.get('size'), 'alreadyStored': already_stored}
+                return {'videoId': video_id, 'status': 'failed', 'error': 'Download failed or already in progress'}
+            
+            workers = max(1, min(concurrency or DOWNLOAD_CONCURRENCY, DOWNLOAD_CONCURRENCY, len(track_ids) or 1))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='download') as executor:
+                futures = {executor.submit(download, video_id): video_id for video_id in track_ids}
+                for future in as_completed(futures):
+                    try:
+                        item = future.result()
+                    except Exception as e:
+                        item = {'videoId': futures[future], 'status': 'failed', 'error': str(e)}
+                    with self._lock:
+                        job['tracks'][item['videoId']] = item
+                    self._emit(job, item, progressive, request_id)
+            with self._lock:
+                job['status'] = 'done'
+        except Exception as e:
+            logger.error(f"Download job {job['jobId']} failed: {e}")
+            with self._lock:
+                job['status'], job['error'] = 'failed', str(e)
+        if progressive:
+            self._emit(job, {'status': job['status'], 'done': True}, True, request_id)
+
+    def _reserve(self, size: int) -> bool:
+        """Claim budget for a transfer before it starts, so concurrent transfers cannot overshoot together"""
+        with self._lock:
+            if audio_store.pinned_bytes() + self._reserved + size > self.max_bytes:
+                return False
+            self._reserved += size
+            return True
+
+    def _release(self, size: int):
+        """The transfer finished - its bytes are now pinned in the store (or were never stored)"""
+        with self._lock:
+            self._reserved -= size
+
+    def status(self, job_id: Optional[str] = None) -> Dict[str, Any]:
+        """Progress of one job, or a summary of every kept job"""
+        with self._lock:
+            jobs = [self._jobs[job_id]] if job_id in self._jobs else [] if job_id else list(self._jobs.values())
+            summaries = []
+            for job in jobs:
+                tracks = [dict(item) for item in job['tracks'].values()]
+                summaries.append({
+                    'jobId': job['jobId'],
+                    'status': job['status'],
+                    'error': job['error'],
+                    'total': len(tracks),
+                    'stored': sum(1 for item in tracks if item['status'] == 'stored'),
+                    'failed': sum(1 for item in tracks if item['status'] in ('failed', 'skipped')),
+                    'budgetExceeded': job['budgetExceeded'],
+                    'tracks': tracks if job_id else None
+                })
+        if job_id and not summaries:
+            return {
+                'success': False,
+                'error': f'Unknown download job: {job_id}'
+            }
+        return {
+            'success': True,
+            'data': summaries[0] if job_id else {
+                'jobs': summaries,
+                'pinnedBytes': audio_store.pinned_bytes(),
+                'maxBytes': self.max_bytes
+            }
+        }
+
+download_manager = DownloadManager()
+
+# MARK: - Queue Prefetch
+
+QUEUE_PREFETCH_COUNT = int(os.environ.get('IZZY_QUEUE_PREFETCH_COUNT', 2))  # upcoming tracks kept resolved
+QUEUE_PREFETCH_REFRESH_AHEAD = 1200.0  # seconds - covers the track length plus the wait until it starts
+QUEUE_PREFETCH_CHECK_INTERVAL = 60.0  # seconds between freshness checks while idle
+
+class QueuePrefetcher:
+    """
+    Keeps stream URLs for the next K queued tracks resolved and fresh on the background lane,
+    so track changes are answered from the stream cache
+    """
+
+    def __init__(self, count: int = QUEUE_PREFETCH_COUNT):
+        self.count = count
+        self._source = None
+        self._policy = None
+        self._window = []  # upcoming video IDs, in play order
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self.resolved = 0
+        self.served = 0
+
+    def set_queue(self, music_source: str, video_ids: List[str], count: Optional[int] = None,
+                  quality_policy: Optional[str] = None) -> List[str]:
+        """Replace the prefetch window with the first `count` upcoming tracks, resolved under `quality_policy`"""
+        window = list(dict.fromkeys(v for v in video_ids or [] if v))[:count or self.count]
+        with self._lock:
+            self._source = music_source
+            self._policy = normalize_quality_policy(quality_policy)
+            self._window = window
+        self.schedule()
+        return window
+
+    def consumed(self, music_source: str, video_id: str):
+        """A prefetched track was requested - it no longer needs to be kept fresh"""
+        with self._lock:
+            if music_source == self._source and video_id in self._window:
+                self._window.remove(video_id)
+                self.served += 1
+
+    def schedule(self):
+        with self._lock:
+            if self._scheduled or not self._window:
+                return
+            self._scheduled = True
+        background_lane.submit(self.refresh)
+
+    def _needs_refresh(self, music_source: str, cache_id: str) -> bool:
+        expires_in = stream_cache.expires_in(music_source, cache_id)
+        return expires_in is None or expires_in < stream_cache.margin + QUEUE_PREFETCH_REFRESH_AHEAD
+
+    def refresh(self):
+        """Background lane task: resolve any window entry that is missing or about to go stale"""
+        with self._lock:
+            self._scheduled = False
+            music_source, policy, window = self._source, self._policy, list(self._window)
+        for video_id in window:
+            if background_lane.should_yield():
+                self.schedule()  # Pick up where we left off once the interactive request is done
+                return
+            with self._lock:
+                if video_id not in self._window or music_source != self._source:
+                    continue  # Already played or queue changed
+            cache_id = stream_cache_id(video_id, policy)
+            if not self._needs_refresh(music_source, cache_id):
+                continue
+            response = get_service(music_source).get_stream_info(video_id, policy)
+            if response.get('success') and response.get('data'):
+                stream_cache.put(music_source, cache_id, response['data'])
+                self.resolved += 1
+        
+        # The very next track also gets its first bytes held in memory
+        if window and not background_lane.should_yield():
+            with self._lock:
+                next_track = window[0] if window[0] in self._window and music_source == self._source else None
+            if next_track:
+                prefetch_track_bytes(music_source, next_track, quality_policy=policy)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'window': list(self._window),
+                'resolved': self.resolved,
+                'served': self.served
+            }
+
+queue_prefetcher = QueuePrefetcher()
+
+# MARK: - Initial-Bytes Prefetch
+
+# ⚡ The first bytes of the next queued track (and optionally the tail of the current one) are held
+# in memory, so a track change starts from local memory instead of waiting for CDN connect + first byte
+PREFETCH_HEAD_BYTES = int(os.environ.get('IZZY_PREFETCH_HEAD_KB', 384)) * 1024  # 0 disables
+PREFETCH_TAIL_BYTES = int(os.environ.get('IZZY_PREFETCH_TAIL_KB', 256)) * 1024  # only when a request asks for it
+PREFETCH_BYTES_BUDGET = int(os.environ.get('IZZY_PREFETCH_BYTES_MB', 16)) * 1024 * 1024
+
+class PrefetchedBytes:
+    """
+    Bounded in-memory segments of upcoming audio keyed by (source, id, format, start offset)
+    Handed over through the audio proxy or as a base64 `prefetched_bytes` handle
+    """
+
+    def __init__(self, budget: int = PREFETCH_BYTES_BUDGET):
+        self.budget = budget
+        self._segments = OrderedDict()  # handle -> {'source', 'id', 'formatId', 'start', 'total', 'data'}
+        self._lock = threading.Lock()
+        self.fetched = 0
+        self.served_bytes = 0
+
+    @staticmethod
+    def handle(source: str, track_id: str, format_id: Optional[str], start: int) -> str:
+        return f"{source}:{track_id}:{format_id}:{start}"
+
+    def _put(self, segment: Dict[str, Any]) -> str:
+        handle = self.handle(segment['source'], segment['id'], segment['formatId'], segment['start'])
+        with self._lock:
+            self._segments[handle] = segment
+            self._segments.move_to_end(handle)
+            while sum(len(seg['data']) for seg in self._segments.values()) > self.budget and len(self._segments) > 1:
+                self._segments.popitem(last=False)
+        return handle
+
+    def get(self, handle: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            segment = self._segments.get(handle)
+            if segment is not None:
+                self._segments.move_to_end(handle)
+            return segment
+
+    def segments_for(self, source: str, track_id: str, format_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(seg, handle=handle) for handle, seg in self._segments.items()
+                    if seg['source'] == source and seg['id'] == track_id
+                    and (format_id is None or seg['formatId'] == format_id)]
+
+    def covering(self, source: str, track_id: str, format_id: Optional[str], offset: int) -> Optional[bytes]:
+        """Held bytes of this exact format starting at `offset` (None when no segment covers it)"""
+        for segment in self.segments_for(source, track_id, format_id):
+            position = offset - segment['start']
+            if 0 <= position < len(segment['data']):
+                return segment['data'][position:]
+        return None
+
+    def fetch(self, source: str, track_id: str, tail: bool = False, policy: Optional[str] = None) -> Optional[str]:
+        """
+        Fetch and hold the head (or the tail) of the format `policy` picks for a track; returns the handle
+        """
+        size = PREFETCH_TAIL_BYTES if tail else PREFETCH_HEAD_BYTES
+        if size <= 0 or not HAS_REQUESTS or audio_store.contains(source, track_id):
+            return None  # Disabled, or the track plays from disk anyway
+        fmt, _ = resolve_pinned_format(source, track_id, policy)
+        if not tail and self.segments_for(source, track_id, fmt.get('formatId')):
+            return None
+        byte_range = f"bytes=-{size}" if tail else f"bytes=0-{size - 1}"
+        for fresh in (False, True):
+            if fresh:
+                fmt, _ = resolve_pinned_format(source, track_id, policy, format_id=fmt.get('formatId'), fresh=True)
+            response = requests.get(fmt['url'], headers={'Range': byte_range}, timeout=AUDIO_PROXY_TIMEOUT)
+            if response.status_code == 206:
+                break
+            if response.status_code not in (401, 403, 404, 410):
+                raise Exception(f"HTTP {response.status_code}")
+        else:
+            raise Exception(f"HTTP {response.status_code}")
+        
+        content_range = re.match(r'bytes (\d+)-\d+/(\d+)', response.headers.get('Content-Range', ''))
+        if not content_range:
+            raise Exception('Upstream did not return a byte range')
+        with self._lock:
+            self.fetched += 1
+        print(f"⚡ Prefetched {len(response.content)} {'tail' if tail else 'head'} bytes of {track_id}", file=sys.stderr)
+        return self._put({
+            'source': source,
+            'id': track_id,
+            'formatId': fmt.get('formatId'),
+            'start': int(content_range.group(1)),
+            'total': int(content_range.group(2)),
+            'data': response.content
+        })
+
+    def count_served(self, length: int):
+        """Proxy threads report bytes answered from memory"""
+        with self._lock:
+            self.served_bytes += length
+
+    def describe(self, source: str, track_id: str, format_id: Optional[str]) -> List[Dict[str, Any]]:
+        """Handles for held segments of a track's format, for stream responses"""
+        return [{'handle': seg['handle'], 'offset': seg['start'], 'length': len(seg['data']), 'total': seg['total']}
+                for seg in self.segments_for(source, track_id, format_id)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'segments': len(self._segments),
+                'bytes': sum(len(seg['data']) for seg in self._segments.values()),
+                'budget': self.budget,
+                'fetched': self.fetched,
+                'servedBytes': self.served_bytes
+            }
+
+prefetched_bytes = PrefetchedBytes()
+
+def prefetch_track_bytes(music_source: str, video_id: str, tail: bool = False, quality_policy: Optional[str] = None):
+    """Background lane task wrapper - failures only cost the speed-up"""
+    try:
+        prefetched_bytes.fetch(music_source, video_id, tail, quality_policy)
+    except Exception as e:
+        print(f"Byte prefetch failed for {video_id}: {e}", file=sys.stderr)
+
+# MARK: - Multi-Source Search
+
+# Sources queried by musicSource "all", in merge priority order
+MERGED_SEARCH_SOURCES = ('youtube_music', 'jiosaavn')
+MERGE_DURATION_BUCKET = 5  # seconds - the same recording differs by a second or two across sources
+
+# One worker per merged source
+_search_executor = ThreadPoolExecutor(max_workers=len(MERGED_SEARCH_SOURCES), thread_name_prefix='search')
+
+def _merge_key(item: Dict[str, Any]) -> Tuple:
+    """Build a source-independent identity for a search result: title + primary artist + duration"""
+    artist = re.split(r'[,&]', item.get('artist') or '')[0]
+    duration = item.get('duration')
+    duration_bucket = int(round(float(duration) / MERGE_DURATION_BUCKET)) if duration else None
+    return (item.get('type'), normalize_query(item.get('title') or ''), normalize_query(artist), duration_bucket)
+
+def merged_search(query: str, limit: int, categories: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Search every source concurrently and merge the results per category
+    Items are interleaved by rank, tagged with their `source`, and duplicates are collapsed
+    """
+    futures = {
+        source: _search_executor.submit(cached_search, get_service(source), source, query, limit, categories)
+        for source in MERGED_SEARCH_SOURCES
+    }
+    
+    source_results = {}
+    errors = []
+    for source, future in futures.items():
+        try:
+            response = future.result()
+        except Exception as e:
+            response = {'success': False, 'error': str(e)}
+        if response.get('success'):
+            source_results[source] = response.get('data') or {}
+        else:
+            errors.append(f"{source}: {response.get('error', 'unknown error')}")
+    
+    if not source_results:
+        return {
+            'success': False,
+            'error': f"Search failed for all sources ({'; '.join(errors)})"
+        }
+    
+    merged = {}
+    for category in SEARCH_CATEGORIES:
+        lists = [source_results.get(source, {}).get(category) or [] for source in MERGED_SEARCH_SOURCES]
+        seen = set()
+        items = []
+        for rank in range(max((len(l) for l in lists), default=0)):
+            for source, source_items in zip(MERGED_SEARCH_SOURCES, lists):
+                if rank >= len(source_items) or len(items) >= limit:
+                    continue
+                item = source_items[rank]
+                key = _merge_key(item)
+                if key in seen:
+                    continue
+                seen.add(key)
+                items.append(dict(item, source=source))
+        merged[category] = items
+    
+    return {
+        'success': True,
+        'data': merged
+    }
+
+def get_suggestions(service, music_source: str, query: str, limit: int = 10) -> Dict[str, Any]:
+    """
+    Autocomplete a partial query from the local trie, going upstream only on a trie miss
+    """
+    local_suggestions = suggestion_trie.complete(query, limit)
+    if local_suggestions:
+        return {
+            'success': True,
+            'data': local_suggestions,
+            'origin': 'local'
+        }
+    
+    key = (music_source, normalize_query(query))
+    cached_suggestions = suggestion_cache.get(key)
+    if cached_suggestions is not None:
+        return {
+            'success': True,
+            'data': cached_suggestions[:limit],
+            'origin': 'upstream',
+            'cached': True
+        }
+    
+    response = service.get_search_suggestions(query)
+    if response.get('success'):
+        suggestion_cache.put(key, response['data'])
+        response['data'] = response['data'][:limit]
+        response['origin'] = 'upstream'
+    return response
+
+# MARK: - Query History & Search Prefetch
+
+PREFETCH_TOP_QUERIES = int(os.environ.get('IZZY_PREFETCH_TOP_QUERIES', 10))  # 0 disables prefetching
+PREFETCH_INTERVAL = float(os.environ.get('IZZY_PREFETCH_INTERVAL', 300))  # seconds between refresh passes
+QUERY_HISTORY_SIZE = 500  # queries
+QUERY_HISTORY_HALF_LIFE = 3 * 86400.0  # seconds - older searches count for less
+QUERY_HISTORY_TYPING_WINDOW = 60.0  # seconds - a query extended within this window was a keystroke prefix
+QUERY_HISTORY_SAVE_INTERVAL = 300.0  # seconds between idle-lane saves of a changed history
+
+class QueryHistory:
+    """
+    Frequency/recency model of the user's searches used to predict the next ones
+    """
+
+    def __init__(self, path: Optional[str] = None, max_queries: int = QUERY_HISTORY_SIZE):
+        self.path = path
+        self.max_queries = max_queries
+        self._queries = {}  # (source, normalized query, limit, categories) -> entry
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for entry in json.load(f).get('queries', []):
+                    entry['categories'] = tuple(entry['categories'])
+                    self._queries[self._key(entry)] = entry
+        except Exception as e:
+            logger.warning(f"Could not load query history: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            queries = [dict(entry, categories=list(entry['categories'])) for entry in self._queries.values()]
+            self._dirty = False
+        try:
+            write_json_atomic(self.path, {'version': 1, 'queries': queries})
+        except Exception as e:
+            logger.warning(f"Could not save query history: {e}")
+
+    @staticmethod
+    def _key(entry: Dict[str, Any]) -> Tuple:
+        return (entry['source'], normalize_query(entry['query']), entry['limit'], entry['categories'])
+
+    def _score(self, entry: Dict[str, Any], now: float) -> float:
+        return entry['count'] * 0.5 ** ((now - entry['lastUsed']) / QUERY_HISTORY_HALF_LIFE)
+
+    def save_if_changed(self):
+        """Idle task: persist the history when searches were recorded since the last save"""
+        with self._lock:
+            dirty = self._dirty
+        if dirty:
+            self.save()
+
+    def record(self, source: str, query: str, limit: int, categories: Optional[List[str]] = None):
+        """
+        Count a completed search; a one-off entry for a shorter prefix searched moments ago is
+        dropped, since it was just the query being typed
+        """
+        normalized = normalize_query(query)
+        if not normalized:
+            return
+        now = time.time()
+        entry = {'source': source, 'query': query.strip(), 'limit': int(limit),
+                 'categories': normalize_categories(categories), 'count': 0, 'lastUsed': now}
+        key = self._key(entry)
+        with self._lock:
+            typed = [k for k, other in self._queries.items()
+                     if k[0] == key[0] and k[2:] == key[2:] and k[1] != normalized and normalized.startswith(k[1])
+                     and other['count'] == 1 and now - other['lastUsed'] <= QUERY_HISTORY_TYPING_WINDOW]
+            for k in typed:
+                del self._queries[k]
+            entry = self._queries.setdefault(key, entry)
+            entry['count'] += 1
+            entry['lastUsed'] = now
+            self._dirty = True
+            if len(self._queries) > self.max_queries:
+                weakest = min(self._queries, key=lambda k: self._score(self._queries[k], now))
+                del self._queries[weakest]
+
+    def top(self, count: int) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            ranked = sorted(self._queries.values(), key=lambda entry: self._score(entry, now), reverse=True)
+            return [dict(entry) for entry in ranked[:count]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'queries': len(self._queries)}
+
+def _open_query_history() -> QueryHistory:
+    if not IS_SERVICE_PROCESS:
+        return QueryHistory()
+    try:
+        return QueryHistory(os.path.join(get_data_dir(), 'query_history.json'))
+    except Exception as e:
+        logger.warning(f"Query history will not be persisted: {e}")
+        return QueryHistory()
+
+query_history = _open_query_history()
+if IS_SERVICE_PROCESS:
+    atexit.register(query_history.save)
+prefetch_stats = {'refreshed': 0, 'skipped': 0}
+
+def prefetch_predicted_searches():
+    """
+    🔋 Background lane idle task: refresh cached results for the top predicted queries
+    Only runs on mains power and stops as soon as an interactive request arrives
+    """
+    if PREFETCH_TOP_QUERIES <= 0 or not on_mains_power():
+        return
+    for entry in query_history.top(PREFETCH_TOP_QUERIES):
+        sources = MERGED_SEARCH_SOURCES if entry['source'] == 'all' else (entry['source'],)
+        for source in sources:
+            if background_lane.should_yield():
+                return
+            key = SearchCache.make_key(source, entry['query'], entry['limit'], list(entry['categories']))
+            age = search_cache.age(key)
+            # Fresh enough entries are left alone - only refresh missing or half-expired results
+            if age is not None and age < search_cache.ttl / 2:
+                prefetch_stats['skipped'] += 1
+                continue
+            response = get_service(source).search_all(entry['query'], entry['limit'], list(entry['categories']))
+            if response.get('success') and any(response.get('data', {}).values()):
+                search_cache.put(key, response['data'])
+                prefix_index.add(source, entry['query'], response['data'])
+                prefetch_stats['refreshed'] += 1
+
+def warm_up_service():
+    """
+    Background lane task run at startup: create the YouTube Music service and, on a cold
+    extractor cache, run one extraction so the player JS and signature functions are cached
+    """
+    extractor_cache.prune()
+    service = get_service('youtube_music')
+    if not HAS_YTDLP or not extractor_cache.path or not extractor_cache.is_cold():
+        return
+    if background_lane.should_yield():
+        background_lane.submit(warm_up_service)  # Retry once the interactive request is done
+        return
+    try:
+        print("🔥 Priming yt-dlp player cache", file=sys.stderr)
+        service._extract_info(f"https://www.youtube.com/watch?v={WARMUP_VIDEO_ID}")
+    except Exception as e:
+        logger.warning(f"yt-dlp warm-up failed: {e}")
+
+def get_cache_stats() -> Dict[str, Any]:
+    """
+    Collect statistics for the service's in-memory caches
+    """
+    youtube_service = _services.get('youtube_music')
+    resolver_counts = stats_snapshot(stream_resolver_stats)
+    return {
+        'success': True,
+        'data': {
+            'ytdlpPool': {profile: pool.stats() for profile, pool in youtube_service.ydl_pools.items()}
+                         if youtube_service and youtube_service.ydl_pools else None,
+            'extractionProfile': dict(stats_snapshot(extraction_profile_stats), profile=EXTRACTION_PROFILE),
+            'extractionLatency': dict(extraction_latency.stats(), hedgeDelay=round(extraction_latency.hedge_delay(), 3)),
+            'streamRefresh': stats_snapshot(stream_refresh_stats),
+            'streamResolver': dict(resolver_counts, enabled=USE_DIRECT_PLAYER_RESOLVER,
+                                   directHitRate=round(resolver_counts['direct'] / max(1, sum(resolver_counts.values())), 3)),
+            'extractionProcesses': youtube_service.extraction_processes.stats() if youtube_service and youtube_service.extraction_processes else None,
+            'search': search_cache.stats(),
+            'searchPrefix': prefix_index.stats(),
+            'suggestionTrie': suggestion_trie.stats(),
+            'suggestions': suggestion_cache.stats(),
+            'trackIndex': track_index.stats(),
+            'searchParser': dict(stats_snapshot(search_parser_stats), enabled=USE_FAST_SEARCH_PARSER),
+            'streams': stream_cache.stats(),
+            'ytdlpCache': extractor_cache.stats(),
+            'queryHistory': query_history.stats(),
+            'searchPrefetch': dict(prefetch_stats),
+            'backgroundLane': background_lane.stats(),
+            'queuePrefetch': queue_prefetcher.stats(),
+            'audioProxy': audio_proxy.stats(),
+            'audioStore': audio_store.stats(),
+            'prefetchedBytes': prefetched_bytes.stats(),
+            'jiosaavnSongs': _services['jiosaavn'].song_cache_stats() if 'jiosaavn' in _services else None
+        }
+    }
+
+def handle_request(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Handle incoming requests from Swift
+    """
+    try:
+        # Get the music source from the request (default to YouTube Music)
+        music_source = request_data.get('musicSource', 'youtube_music')
+        print(f"🎵 Python received musicSource: '{music_source}'", file=sys.stderr)
+        
+        action = request_data.get('action')
+        
+        # Actions answered locally (work offline, no service needed)
+        if action == 'local_search':
+            query = request_data.get('query', '')
+            limit = request_data.get('limit', 20)
+            sort = request_data.get('sort', 'relevance')  # relevance | recent | plays
+            source_filter = music_source if music_source in MERGED_SEARCH_SOURCES else None
+            return {
+                'success': True,
+                'data': track_index.search(query, limit, sort, source_filter)
+            }
+            
+        elif action == 'cache_stats':
+            return get_cache_stats()
+        
+        if music_source == 'all' and action == 'search':
+            print("🔥 Using all music sources", file=sys.stderr)
+            query = request_data.get('query', '')
+            limit = request_data.get('limit', 20)
+            categories = request_data.get('categories')
+            if not request_data.get('provisional'):  # Search-as-you-type keystrokes are not history
+                query_history.record(music_source, query, limit, categories)
+            if request_data.get('topResult'):
+                # The top result comes from the primary source
+                primary_source = MERGED_SEARCH_SOURCES[0]
+                return search_with_top_result(get_service(primary_source), primary_source, query,
+                                              lambda: merged_search(query, limit, categories),
+                                              request_data.get('requestId'),
+                                              normalize_quality_policy(request_data.get('qualityPolicy')))
+            return merged_search(query, limit, categories)
+        
+        if music_source == 'jiosaavn':
+            print("🔥 Using JioSaavn service", file=sys.stderr)
+        else:
+            # Non-search actions in "all" mode go to YouTube Music unless the client
+            # passes the item's own `source` as musicSource
+            print("🔥 Using YouTube Music service", file=sys.stderr)
+            music_source = 'youtube_music'
+        service = get_service(music_source)
+            
+        print(f"🎵 Action: {action}", file=sys.stderr)
+        
+        if action == 'search':
+            query = request_data.get('query', '')
+            limit = request_data.get('limit', 20)
+            categories = request_data.get('categories')  # Optional subset of SEARCH_CATEGORIES
+            provisional = bool(request_data.get('provisional', False))  # Opt-in search-as-you-type
+            if not provisional:  # Keystroke prefixes would crowd out real queries in the history
+                query_history.record(music_source, query, limit, categories)
+            if request_data.get('topResult'):  # Opt-in early best match with its stream URL
+                return search_with_top_result(service, music_source, query,
+                                              lambda: cached_search(service, music_source, query, limit, categories),
+                                              request_data.get('requestId'),
+                                              normalize_quality_policy(request_data.get('qualityPolicy')))
+            return cached_search(service, music_source, query, limit, categories,
+                                 provisional=provisional, request_id=request_data.get('requestId'))
+            
+        elif action == 'suggest':
+            query = request_data.get('query', '')
+            limit = request_data.get('limit', 10)
+            return get_suggestions(service, music_source, query, limit)
+            
+        elif action == 'stream':
+            video_id = request_data.get('videoId', '')
+            quality_policy = normalize_quality_policy(request_data.get('qualityPolicy'))
+            queue_prefetcher.consumed(music_source, video_id)
+            local_response = audio_store.stream_response(music_source, video_id)
+            if local_response is not None:
+                track_index.record_play(music_source, video_id)
+                audio_store.track_started(music_source, video_id, quality_policy)
+                return local_response
+            response = resolve_stream(service, music_source, video_id, quality_policy)
+            if response.get('success'):
+                track_index.record_play(music_source, video_id)
+                audio_store.track_started(music_source, video_id, quality_policy)
+            if not request_data.get('includeFormats'):  # Opt-in full format ladder
+                response = without_format_ladder(response)
+            if response.get('success'):
+                held = prefetched_bytes.describe(music_source, video_id, response['data'].get('formatId'))
+                if held:
+                    response = dict(response, data=dict(response['data'], prefetchedBytes=held))
+            if HAS_REQUESTS and request_data.get('proxy', AUDIO_PROXY_ENABLED):
+                response = audio_proxy.proxied(response, music_source, video_id, quality_policy)
+            return response
+            
+        elif action == 'refresh_stream':
+            # Recover from an expired/403 URL mid-playback on the same, byte-compatible format
+            video_id = request_data.get('videoId', '')
+            quality_policy = normalize_quality_policy(request_data.get('qualityPolicy'))
+            context = service.stream_context(video_id) if hasattr(service, 'stream_context') else {}
+            previous_format = request_data.get('formatId') or context.get('formatId')
+            previous_length = request_data.get('contentLength') or context.get('contentLength')
+            started = time.monotonic()
+            response = refresh_stream(service, music_source, video_id, quality_policy)
+            if not response.get('success') or not response.get('data'):
+                return {
+                    'success': False,
+                    'error': f"Stream refresh failed: {response.get('error', 'no stream data')}"
+                }
+            data = response['data']
+            formats = [f for f in data.get('formats') or [] if f.get('url')]
+            fmt = next((f for f in formats if f.get('formatId') == previous_format), None)
+            # Same itag and (when both are known) the same length: byte offsets carry over
+            byte_compatible = fmt is not None and (not previous_length or not fmt.get('contentLength')
+                                                   or int(previous_length) == int(fmt['contentLength']))
+            if fmt is None:
+                # The format is no longer offered - hand back the policy's pick as a replacement
+                fmt = next((f for f in formats if f.get('formatId') == data.get('formatId')), None) or data
+            data = dict(data, url=fmt['url'], formatId=fmt.get('formatId'), bitrate=fmt.get('bitrate'),
+                        estimatedSize=fmt.get('estimatedSize'), contentLength=fmt.get('contentLength'),
+                        previousFormatId=previous_format, byteCompatible=byte_compatible,
+                        refreshSeconds=round(time.monotonic() - started, 3))
+            response = {'success': True, 'data': data}
+            if not request_data.get('includeFormats'):
+                response = without_format_ladder(response)
+            if HAS_REQUESTS and request_data.get('proxy', AUDIO_PROXY_ENABLED):
+                response = audio_proxy.proxied(response, music_source, video_id, quality_policy)
+            return response
+            
+        elif action == 'streams':
+            video_ids = request_data.get('videoIds') or []
+            return resolve_streams(service, music_source, video_ids,
+                                   concurrency=request_data.get('concurrency'),
+                                   progressive=bool(request_data.get('progressive', False)),
+                                   request_id=request_data.get('requestId'),
+                                   quality_policy=normalize_quality_policy(request_data.get('qualityPolicy')),
+                                   include_formats=bool(request_data.get('includeFormats', False)))
+            
+        elif action == 'download':
+            return download_manager.start(service, music_source,
+                                          album_id=request_data.get('browseId'),
+                                          playlist_id=request_data.get('playlistId'),
+                                          video_ids=request_data.get('videoIds'),
+                                          quality_policy=normalize_quality_policy(request_data.get('qualityPolicy')),
+                                          concurrency=request_data.get('concurrency'),
+                                          progressive=bool(request_data.get('progressive', False)),
+                                          request_id=request_data.get('requestId'))
+            
+        elif action == 'download_status':
+            return download_manager.status(request_data.get('jobId'))
+            
+        elif action == 'remove_download':
+            video_ids = request_data.get('videoIds') or []
+            return {
+                'success': True,
+                'data': {'removed': [v for v in video_ids if audio_store.remove(music_source, v)]}
+            }
+            
+        elif action == 'prefetch_queue':
+            video_ids = request_data.get('videoIds') or []
+            quality_policy = normalize_quality_policy(request_data.get('qualityPolicy'))
+            window = queue_prefetcher.set_queue(music_source, video_ids, request_data.get('count'), quality_policy)
+            if request_data.get('currentVideoId') and request_data.get('tail'):  # Opt-in tail of the playing track
+                background_lane.submit(prefetch_track_bytes, music_source, request_data['currentVideoId'], True,
+                                       quality_policy)
+            return {
+                'success': True,
+                'data': {'prefetching': window}
+            }
+            
+        elif action == 'prefetched_bytes':
+            segment = prefetched_bytes.get(request_data.get('handle', ''))
+            if segment is None:
+                return {
+                    'success': False,
+                    'error': 'Prefetched bytes are no longer held'
+                }
+            return {
+                'success': True,
+                'data': {
+                    'offset': segment['start'],
+                    'length': len(segment['data']),
+                    'total': segment['total'],
+                    'formatId': segment['formatId'],
+                    'bytes': base64.b64encode(segment['data']).decode('ascii')
+                }
+            }
+            
+        elif action == 'album_tracks':
+            browse_id = request_data.get('browseId', '')
+            return service.get_album_tracks(browse_id)
+            
+        elif action == 'playlist_tracks':
+            playlist_id = request_data.get('playlistId', '')
+            return service.get_playlist_tracks(playlist_id)
+            
+        elif action == 'artist_songs':
+            browse_id = request_data.get('browseId', '')
+            return service.get_artist_songs(browse_id)
+            
+        elif action == 'watch_playlist':
+            video_id = request_data.get('videoId', '')
+            playlist_id = request_data.get('playlistId')  # Optional
+            return service.get_watch_playlist(video_id, playlist_id)
+            
+        elif action == 'song_suggestions':
+            video_id = request_data.get('videoId', '')
+            return service.get_song_suggestions(video_id)
+            
+        elif action == 'lyrics':
+            video_id = request_data.get('videoId', '')
+            return service.get_lyrics(video_id)
+            
+        elif action == 'mood_categories':
+            return service.get_mood_categories()
+            
+        elif action == 'mood_playlists':
+            params = request_data.get('params', '')
+            return service.get_mood_playlists(params)
+            
+        elif action == 'charts':
             country = request_data.get('country', 'ZZ')
             return service.get_charts(country)
             
@@ -1613,7 +5273,19 @@ def main():
         'success': True,
         'data': {'status': 'service_ready', 'has_ytmusicapi': HAS_YTMUSICAPI, 'has_ytdlp': HAS_YTDLP}
     }
-    print(json.dumps(startup_response), flush=True)
+    emit_response(startup_response)
+    
+    # Exit cleanly on terminate() from Swift so caches and history are flushed by atexit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    # 🔋 Speculative work only runs on the background lane while the service is idle
+    background_lane.submit(warm_up_service)
+    background_lane.add_idle_task(extractor_cache.prune, 3600)
+    background_lane.add_idle_task(prefetch_predicted_searches, PREFETCH_INTERVAL)
+    background_lane.add_idle_task(query_history.save_if_changed, QUERY_HISTORY_SAVE_INTERVAL)
+    background_lane.add_idle_task(queue_prefetcher.schedule, QUEUE_PREFETCH_CHECK_INTERVAL)
+    background_lane.add_idle_task(audio_store.verify, 3600)
+    background_lane.add_idle_task(audio_store.fill_deferred, AUDIO_CACHE_FILL_INTERVAL)
     
     try:
         while True:
@@ -1631,13 +5303,21 @@ def main():
                 print(f"Received request: {line}", file=sys.stderr, flush=True)
                 
                 request_data = json.loads(line)
-                response = handle_request(request_data)
+                background_lane.interactive_started()
+                try:
+                    response = handle_request(request_data)
+                finally:
+                    background_lane.interactive_finished()
+                
+                # Echo the optional request id so clients can match multi-response requests
+                if isinstance(request_data, dict) and request_data.get('requestId') is not None:
+                    response.setdefault('requestId', request_data['requestId'])
                 
                 # Log response to stderr for debugging
                 print(f"Sending response: {json.dumps(response)}", file=sys.stderr, flush=True)
                 
                 # Write response to stdout
-                print(json.dumps(response), flush=True)
+                emit_response(response)
                 
             except json.JSONDecodeError as e:
                 error_response = {
@@ -1645,7 +5325,7 @@ def main():
                     'error': f'Invalid JSON: {str(e)}'
                 }
                 print(f"JSON decode error: {e}", file=sys.stderr, flush=True)
-                print(json.dumps(error_response), flush=True)
+                emit_response(error_response)
                 
             except Exception as e:
                 error_response = {
@@ -1653,7 +5333,7 @@ def main():
                     'error': str(e)
                 }
                 print(f"Request error: {e}", file=sys.stderr, flush=True)
-                print(json.dumps(error_response), flush=True)
+                emit_response(error_response)
                 
     except KeyboardInterrupt:
         print("Service interrupted", file=sys.stderr, flush=True)
@@ -1661,5 +5341,30 @@ def main():
     except Exception as e:
         print(f"Main loop error: {e}", file=sys.stderr, flush=True)
 
+def benchmark_extraction(video_ids: List[str], runs: int = 3):
+    """
+    Compare per-extraction time of the extraction profiles (bypasses the stream cache)
+    Usage: python3 ytmusic_service.py --benchmark-extraction [VIDEO_ID ...]
+    """
+    service = YTMusicService()
+    timings = {}
+    for profile in EXTRACTION_PROFILES:
+        samples = []
+        for video_id in video_ids:
+            url = f"https://music.youtube.com/watch?v={video_id}"
+            service._extract_stream_from_url(url, profile)  # Warm the player cache and pooled instance
+            for _ in range(runs):
+                started = time.perf_counter()
+                service._extract_stream_from_url(url, profile)
+                samples.append(time.perf_counter() - started)
+        timings[profile] = sum(samples) / len(samples)
+        print(f"{profile:>10}: {timings[profile] * 1000:8.1f} ms per extraction ({len(samples)} runs)")
+    if 'full' in timings and 'audio_fast' in timings:
+        saving = timings['full'] - timings['audio_fast']
+        print(f"    saving: {saving * 1000:8.1f} ms per extraction ({saving / timings['full'] * 100:.0f}%)")
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark-extraction':
+        benchmark_extraction(sys.argv[2:] or [WARMUP_VIDEO_ID])
+    else:
+        main()
\ No newline at end of file